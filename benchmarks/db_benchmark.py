@@ -0,0 +1,152 @@
+# codesnap/benchmarks/db_benchmark.py
+"""
+Measures per-call latency of the database layer on a synthetic library.
+
+    python benchmarks/db_benchmark.py [--snippets 50000] [--calls 200]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database_manager as db
+
+LANGUAGES = ['python', 'javascript', 'sql', 'html', 'css', 'bash', 'text']
+VERBS = ['parse', 'fetch', 'render', 'cache', 'load', 'retry', 'stream', 'split',
+         'open', 'index', 'query', 'build', 'merge', 'format', 'export', 'sort']
+NOUNS = ['config', 'token', 'socket', 'widget', 'thread', 'buffer', 'user', 'image',
+         'table', 'event', 'queue', 'file', 'path', 'header', 'record', 'session']
+# ~4k distinct identifiers so each word hits a realistic fraction of the library
+WORDS = [f"{verb}{noun}{n}" for verb in VERBS for noun in NOUNS for n in range(16)]
+
+
+def make_snippet(rng, i):
+    words = rng.sample(WORDS, 3)
+    title = f"{' '.join(words)} {i}"
+    tags = ", ".join(rng.sample(WORDS, 2))
+    body = "\n".join(
+        f"def {rng.choice(WORDS)}_{j}(x):\n    return {rng.choice(WORDS)}(x) + {j}"
+        for j in range(rng.randint(3, 30))
+    )
+    return title, rng.choice(LANGUAGES), tags, body, int(rng.random() < 0.1)
+
+
+def populate(path, count, seed=1234):
+    rng = random.Random(seed)
+    db.DB_FILE = path
+    db.initialize_db()
+    db.add_snippets(make_snippet(rng, i) for i in range(count))
+
+
+def old_style(sql, params=()):
+    # What every database_manager function used to do before the connection layer
+    conn = sqlite3.connect(db.DB_FILE)
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute(sql, params).fetchall()
+    conn.close()
+    return rows
+
+
+def timed(fn, calls):
+    samples = []
+    for i in range(calls):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    if len(samples) < 2:
+        return samples[0], samples[0]
+    return statistics.median(samples), statistics.quantiles(samples, n=20)[-1]
+
+
+def report(name, before, after):
+    print(f"{name:<28} {before[0]:>9.3f} {before[1]:>9.3f}   {after[0]:>9.3f} {after[1]:>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--snippets", type=int, default=50_000)
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        print(f"Populating {args.snippets} snippets...")
+        populate(path, args.snippets)
+        db.close_db()
+        ids = list(range(1, args.snippets + 1))
+        # Both columns of a row take the same number of samples; rows whose
+        # old query reads the whole table take fewer
+        slow_calls = args.calls // 10 or 1
+
+        print(f"\n{'call (ms)':<28} {'before p50':>9} {'p95':>9}   {'after p50':>9} {'p95':>9}")
+        report(
+            "get_snippet_by_id",
+            timed(lambda i: old_style("SELECT * FROM snippets WHERE id = ?", (ids[i * 7919 % len(ids)],)), args.calls),
+            timed(lambda i: db.get_snippet_by_id(ids[i * 7919 % len(ids)]), args.calls),
+        )
+        report(
+            "list page (200 rows)",
+            timed(lambda i: old_style(
+                "SELECT id, title, language, tags, is_favorite FROM snippets ORDER BY title ASC"
+            )[:200], slow_calls),
+            timed(lambda i: db.get_snippets_page(), slow_calls),
+        )
+        deep = list(db.iter_snippets(limit=args.snippets // 2))[-1]
+        report(
+            "list page at 50%",
+            timed(lambda i: old_style(
+                "SELECT id, title, language, tags, is_favorite FROM snippets ORDER BY title ASC LIMIT 200 OFFSET ?",
+                (args.snippets // 2,),
+            ), slow_calls),
+            timed(lambda i: db.get_snippets_page(deep['title'], deep['id']), slow_calls),
+        )
+        report(
+            "get_favorite_snippets",
+            timed(lambda i: old_style(
+                "SELECT id, title, language, tags, is_favorite FROM snippets WHERE is_favorite = 1 ORDER BY title ASC"
+            ), slow_calls),
+            timed(lambda i: db.get_favorite_snippets(), slow_calls),
+        )
+        queries = random.Random(99).sample(WORDS, 64)
+        report(
+            "search_snippets",
+            timed(lambda i: old_style(
+                "SELECT id, title, language, tags, is_favorite FROM snippets "
+                "WHERE (title LIKE ? OR tags LIKE ? OR language LIKE ?) ORDER BY title ASC",
+                ("%" + queries[i % len(queries)] + "%",) * 3,
+            ), slow_calls),
+            timed(lambda i: db.search_snippets(queries[i % len(queries)]), slow_calls),
+        )
+        report(
+            "search_snippets (prefix)",
+            timed(lambda i: old_style(
+                "SELECT id, title, language, tags, is_favorite FROM snippets "
+                "WHERE (title LIKE ? OR tags LIKE ? OR language LIKE ?) ORDER BY title ASC",
+                ("%" + VERBS[i % len(VERBS)] + "%",) * 3,
+            ), slow_calls),
+            timed(lambda i: db.search_snippets(VERBS[i % len(VERBS)]), slow_calls),
+        )
+        # The first keystrokes, which match most of the library; run with
+        # --snippets 100000 to check they stay interactive at that size
+        short_prefixes = [verb[:n] for verb in VERBS for n in (2, 3)]
+        report(
+            "search_snippets (2-3 chars)",
+            timed(lambda i: old_style(
+                "SELECT id, title, language, tags, is_favorite FROM snippets "
+                "WHERE (title LIKE ? OR tags LIKE ? OR language LIKE ?) ORDER BY title ASC",
+                ("%" + short_prefixes[i % len(short_prefixes)] + "%",) * 3,
+            ), slow_calls),
+            timed(lambda i: db.search_snippets(short_prefixes[i % len(short_prefixes)]), slow_calls),
+        )
+        db.close_db()
+
+
+if __name__ == '__main__':
+    main()
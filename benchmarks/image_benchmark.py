@@ -0,0 +1,126 @@
+# codesnap/benchmarks/image_benchmark.py
+"""
+Compares generate_image against the old ImageFormatter + PNG round-trip path:
+wall time per render and peak memory growth of a fresh process. "new (cold)"
+starts every render with an empty glyph atlas; "tiled png" streams the PNG to
+a file with export_png_tiled (so it also pays for the PNG encoding).
+
+    python benchmarks/image_benchmark.py [--lines 400] [--runs 10] [--font assets/fonts/FiraCode-Regular.ttf]
+"""
+
+import argparse
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import Image
+from pygments import highlight
+from pygments.formatters.img import ImageFormatter
+from pygments.lexers import get_lexer_by_name
+from pygments.styles import get_style_by_name
+
+from core.fonts import glyph_atlas
+from core.image_generator import export_png_tiled, generate_image
+
+SAMPLE = '''\
+class LineCache:
+    """Keeps the last few rendered lines around."""
+    def __init__(self, size=128):
+        self.size = size
+        self.items = {}  # key -> (text, tokens)
+
+    def get(self, key, default=None):
+        if key in self.items:
+            return self.items[key][1]
+        return default
+'''
+
+
+def old_generate_image(code, language, style_name, font_name, font_size, line_numbers):
+    # What generate_image used to do (with the font option spelled so that
+    # Pygments actually uses it): encode a PNG, decode it, paste onto a frame
+    lexer = get_lexer_by_name(language, stripall=True)
+    style = get_style_by_name(style_name)
+    formatter = ImageFormatter(image_format='PNG', style=style, font_name=font_name,
+                               font_size=font_size, line_numbers=line_numbers)
+    image = Image.open(io.BytesIO(highlight(code, lexer, formatter)))
+    bg_color = style.background_color or "#272822"
+    final_image = Image.new('RGBA', (image.width + 40, image.height + 40), bg_color)
+    final_image.paste(image, (20, 20))
+    return final_image
+
+
+def cold_generate_image(*args):
+    # generate_image as the first render of a session sees it
+    glyph_atlas.clear()
+    return generate_image(*args)
+
+
+def tiled_export(*args):
+    # Streams the PNG to disk; returns the (width, height) written
+    with tempfile.TemporaryDirectory() as tmp:
+        return export_png_tiled(*args, os.path.join(tmp, "out.png"))
+
+
+def make_code(lines):
+    body = SAMPLE.splitlines()
+    return "\n".join(body[i % len(body)] for i in range(lines))
+
+
+RENDERERS = {
+    'old': old_generate_image, 'new (cold)': cold_generate_image, 'new': generate_image,
+    'tiled png': tiled_export,
+}
+
+
+def _status_kb(field):
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+
+
+def peak_memory(name, code, font):
+    """Runs in a fresh process: how far one render pushes RSS above where it started (KB)."""
+    render = RENDERERS[name]
+    render(SAMPLE, 'python', 'monokai', font, 16, True)  # imports, fonts, caches
+    # Reset the high-water mark (Linux only), so it covers just this render
+    with open("/proc/self/clear_refs", "w") as clear_refs:
+        clear_refs.write("5")
+    before = _status_kb("VmRSS")
+    result = render(code, 'python', 'monokai', font, 16, True)
+    return _status_kb("VmHWM") - before, result if isinstance(result, tuple) else result.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=400)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--font", default=os.path.join(ROOT, "assets", "fonts", "FiraCode-Regular.ttf"))
+    args = parser.parse_args()
+    code = make_code(args.lines)
+
+    print(f"{args.lines} lines, {args.runs} runs\n")
+    print(f"{'path':<12} {'p50 ms':>9} {'min ms':>9} {'peak +KB':>10}  size")
+    for name, render in RENDERERS.items():
+        render(code, 'python', 'monokai', args.font, 16, True)  # warm up
+        samples = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            render(code, 'python', 'monokai', args.font, 16, True)
+            samples.append((time.perf_counter() - start) * 1000)
+        with ProcessPoolExecutor(1, mp_context=get_context('spawn')) as pool:
+            peak, size = pool.submit(peak_memory, name, code, args.font).result()
+        print(f"{name:<12} {statistics.median(samples):>9.1f} {min(samples):>9.1f} {peak:>10}  {size[0]}x{size[1]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+# codesnap/benchmarks/storage_benchmark.py
+"""
+Compares the database with code stored inline in the snippets rows (the
+layout before code_blobs) against the same library after initialize_db has
+moved it into compressed, deduplicated blobs: file size, and latency of the
+list queries and of reading one snippet.
+
+    python benchmarks/storage_benchmark.py [--snippets 50000] [--duplicates 0.2] [--calls 200]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database_manager as db
+from db_benchmark import VERBS, make_snippet, timed
+
+# The schema initialize_db upgrades from; the search indexes are built
+# without triggers, since the library doesn't change before the upgrade
+INLINE_SCHEMA = (
+    """
+    CREATE TABLE snippets (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        language TEXT NOT NULL,
+        tags TEXT,
+        code TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        is_favorite INTEGER DEFAULT 0,
+        code_hash TEXT
+    )
+    """,
+    "CREATE INDEX idx_snippets_code_hash ON snippets(code_hash)",
+    *db.LIST_INDEXES,
+    """
+    CREATE VIRTUAL TABLE snippets_fts USING fts5(
+        title, tags, language, code,
+        content='snippets', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    "CREATE VIRTUAL TABLE snippets_trigram USING fts5(code, content='snippets', content_rowid='id', tokenize='trigram')",
+)
+
+
+def populate_inline(path, count, duplicates, seed=1234):
+    rng = random.Random(seed)
+    db.DB_FILE = path
+    conn = db.get_db_connection()
+    for statement in INLINE_SCHEMA:
+        conn.execute(statement)
+    snippets = []
+    for i in range(count):
+        title, language, tags, code, is_favorite = make_snippet(rng, i)
+        if snippets and rng.random() < duplicates:
+            code = rng.choice(snippets)[3]  # the same code imported again
+        snippets.append((title, language, tags, code, is_favorite, db.code_hash(code)))
+    with conn:
+        conn.executemany(
+            "INSERT INTO snippets (title, language, tags, code, is_favorite, code_hash) VALUES (?, ?, ?, ?, ?, ?)",
+            snippets,
+        )
+        conn.execute("INSERT INTO snippets_fts(snippets_fts) VALUES ('rebuild')")
+        conn.execute("INSERT INTO snippets_trigram(snippets_trigram) VALUES ('rebuild')")
+        db._create_tag_index(conn.cursor())
+    conn.execute("VACUUM")
+
+
+def database_size(conn):
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return conn.execute("PRAGMA page_count").fetchone()[0] * conn.execute("PRAGMA page_size").fetchone()[0]
+
+
+def measure(conn, ids, deep, calls, get_snippet):
+    rows = {
+        "list page (200 rows)": timed(lambda i: db.get_snippets_page(), calls),
+        "list page at 50%": timed(lambda i: db.get_snippets_page(deep['title'], deep['id']), calls),
+        "get_favorite_snippets": timed(lambda i: db.get_favorite_snippets(), calls // 10 or 1),
+        "search_snippets": timed(lambda i: db.search_snippets(VERBS[i % len(VERBS)]), calls // 10 or 1),
+        "walk whole list": timed(lambda i: sum(1 for _ in db.iter_snippets()), 5),
+        "get_snippet_by_id": timed(lambda i: get_snippet(ids[i * 7919 % len(ids)]), calls),
+    }
+    return rows, database_size(conn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--snippets", type=int, default=50_000)
+    parser.add_argument("--duplicates", type=float, default=0.2, help="share of snippets repeating earlier code")
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        print(f"Populating {args.snippets} snippets with inline code...")
+        populate_inline(path, args.snippets, args.duplicates)
+        conn = db.get_db_connection()
+        ids = list(range(1, args.snippets + 1))
+        deep = list(db.iter_snippets(limit=args.snippets // 2))[-1]
+        code_bytes = conn.execute("SELECT sum(length(CAST(code AS BLOB))) FROM snippets").fetchone()[0]
+
+        before, before_size = measure(
+            conn, ids, deep, args.calls,
+            lambda snippet_id: conn.execute("SELECT * FROM snippets WHERE id = ?", (snippet_id,)).fetchone(),
+        )
+
+        start = time.perf_counter()
+        db.initialize_db()
+        migration = time.perf_counter() - start
+        after, after_size = measure(conn, ids, deep, args.calls, db.get_snippet_by_id)
+        blobs, blob_bytes = conn.execute("SELECT count(*), sum(length(data)) FROM code_blobs").fetchone()
+
+        print(f"\nUpgrade took {migration:.1f} s: {code_bytes / 1e6:.1f} MB of code in {args.snippets} snippets "
+              f"became {blobs} blobs of {blob_bytes / 1e6:.1f} MB")
+        print(f"Database size: {before_size / 1e6:.1f} MB before, {after_size / 1e6:.1f} MB after")
+        print(f"\n{'call (ms)':<28} {'before p50':>9} {'p95':>9}   {'after p50':>9} {'p95':>9}")
+        for name, (p50, p95) in before.items():
+            print(f"{name:<28} {p50:>9.3f} {p95:>9.3f}   {after[name][0]:>9.3f} {after[name][1]:>9.3f}")
+        db.close_db()
+
+
+if __name__ == '__main__':
+    main()
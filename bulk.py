@@ -0,0 +1,261 @@
+# codesnap/bulk.py
+"""
+Bulk snippet import and export.
+
+    python bulk.py import SOURCE [--tags imported] [--workers 4]
+    python bulk.py export OUT.jsonl [--language python] [--tag cli] [--favorites]
+
+SOURCE is a directory or a .zip archive, where every text file becomes a
+snippet titled with its path, or a .jsonl file as written by `export`: one
+{"title", "language", "tags", "code", "is_favorite"} object per line.
+Snippets whose code is already in the database (or earlier in the same
+import) are skipped as duplicates. Languages not known from a file
+extension or the JSONL are guessed in worker processes.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import zipfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import database_manager as db
+
+# The languages the editor offers; guesses outside these become 'text'
+LANGUAGES = ('python', 'javascript', 'sql', 'html', 'css', 'bash', 'text')
+LANGUAGE_BY_EXTENSION = {
+    '.py': 'python', '.pyw': 'python',
+    '.js': 'javascript', '.mjs': 'javascript', '.cjs': 'javascript',
+    '.sql': 'sql',
+    '.html': 'html', '.htm': 'html',
+    '.css': 'css',
+    '.sh': 'bash', '.bash': 'bash',
+    '.txt': 'text',
+}
+# Snippets are written in transactions of this many rows
+CHUNK_ROWS = 1000
+# Larger files are not snippets; skip them
+MAX_FILE_BYTES = 1024 * 1024
+# Report progress every this many seconds
+REPORT_INTERVAL = 2.0
+
+
+def _record(title, code, language=None, tags='', is_favorite=0):
+    return {'title': title, 'language': language, 'tags': tags or '', 'code': code,
+            'is_favorite': 1 if is_favorite else 0}
+
+
+def _file_record(name, data, counts):
+    """Makes a snippet of one file, or counts it as skipped when it isn't text."""
+    if len(data) > MAX_FILE_BYTES:
+        counts['skipped'] += 1
+        return None
+    try:
+        code = data.decode('utf-8')
+    except UnicodeDecodeError:
+        counts['skipped'] += 1
+        return None
+    language = LANGUAGE_BY_EXTENSION.get(os.path.splitext(name)[1].lower())
+    return _record(name, code, language)
+
+
+def _iter_directory(root, counts):
+    for directory, subdirectories, files in os.walk(root):
+        # Skip hidden directories such as .git, and walk in a stable order
+        subdirectories[:] = sorted(d for d in subdirectories if not d.startswith('.'))
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            if os.path.getsize(path) > MAX_FILE_BYTES:
+                counts['skipped'] += 1
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            yield _file_record(os.path.relpath(path, root).replace(os.sep, '/'), data, counts)
+
+
+def _iter_zip(path, counts):
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            # Skip directories, and what directory imports skip: hidden ones like .git
+            if info.is_dir() or any(part.startswith('.') for part in info.filename.split('/')[:-1]):
+                continue
+            if info.file_size > MAX_FILE_BYTES:
+                counts['skipped'] += 1
+                continue
+            yield _file_record(info.filename, archive.read(info), counts)
+
+
+def _iter_jsonl(path, counts):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                yield _record(str(entry.get('title') or 'Untitled'), str(entry['code']),
+                              entry.get('language'), entry.get('tags'), entry.get('is_favorite'))
+            except (ValueError, KeyError, TypeError):
+                counts['skipped'] += 1
+
+
+def iter_source(source, counts):
+    """Yields snippet records (None for skipped files) from a directory, zip or JSONL file."""
+    if os.path.isdir(source):
+        return _iter_directory(source, counts)
+    if zipfile.is_zipfile(source):
+        return _iter_zip(source, counts)
+    return _iter_jsonl(source, counts)
+
+
+def _guess(code):
+    """Runs in a worker process."""
+    from core.lexers import guess_language
+    return guess_language(code, LANGUAGES) or 'text'
+
+
+def _import_chunk(chunk, pool, seen, extra_tags, counts):
+    hashes = [db.code_hash(record['code']) for record in chunk]
+    existing = db.existing_code_hashes(set(hashes) - seen)
+    fresh = []
+    for record, code_hash in zip(chunk, hashes):
+        if code_hash in seen or code_hash in existing:
+            counts['duplicates'] += 1
+            continue
+        seen.add(code_hash)
+        fresh.append(record)
+
+    unknown = [record for record in fresh if record['language'] not in LANGUAGES]
+    if unknown:
+        codes = [record['code'] for record in unknown]
+        guesses = pool.map(_guess, codes, chunksize=64) if pool else map(_guess, codes)
+        for record, language in zip(unknown, guesses):
+            record['language'] = language
+
+    counts['imported'] += db.add_snippets(
+        (record['title'], record['language'], ", ".join(filter(None, (record['tags'], extra_tags))),
+         record['code'], record['is_favorite'])
+        for record in fresh
+    )
+
+
+def import_snippets(source, extra_tags='', workers=None, progress=None):
+    """
+    Imports every snippet of `source` (see iter_source), CHUNK_ROWS to a
+    transaction. `progress(counts, seconds)` is called after each chunk.
+    Returns a Counter of 'imported', 'duplicates' and 'skipped'.
+    """
+    workers = workers or os.cpu_count() or 1
+    counts = Counter(imported=0, duplicates=0, skipped=0)
+    seen = set()
+    start = time.perf_counter()
+    # With a single worker, guessing runs inline rather than in a pool of one
+    pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) if workers > 1 else None
+    try:
+        chunk = []
+        for record in iter_source(source, counts):
+            if record is None:
+                continue
+            if not record['code'].strip():
+                counts['skipped'] += 1
+                continue
+            chunk.append(record)
+            if len(chunk) >= CHUNK_ROWS:
+                _import_chunk(chunk, pool, seen, extra_tags, counts)
+                chunk = []
+                if progress:
+                    progress(counts, time.perf_counter() - start)
+        if chunk:
+            _import_chunk(chunk, pool, seen, extra_tags, counts)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    if progress:
+        progress(counts, time.perf_counter() - start)
+    return counts
+
+
+def export_snippets(path, language=None, tag=None, favorites_only=False, progress=None):
+    """
+    Writes snippets to a JSONL file that import_snippets can read back,
+    streaming them from the database a page at a time. The file appears
+    under its name only once complete. `progress(count, seconds)` is called
+    every CHUNK_ROWS snippets. Returns the number exported.
+    """
+    count = 0
+    start = time.perf_counter()
+    tmp = f"{path}.part"
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for snippet in db.iter_snippets_with_code(language, tag, favorites_only):
+                f.write(json.dumps({
+                    'title': snippet['title'], 'language': snippet['language'], 'tags': snippet['tags'],
+                    'code': snippet['code'], 'is_favorite': bool(snippet['is_favorite']),
+                    'created_at': snippet['created_at'],
+                }, ensure_ascii=False) + "\n")
+                count += 1
+                if progress and count % CHUNK_ROWS == 0:
+                    progress(count, time.perf_counter() - start)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    if progress:
+        progress(count, time.perf_counter() - start)
+    return count
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Import or export snippets in bulk.")
+    parser.add_argument("--db", default=db.DB_FILE, help="snippet database (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="import a directory, .zip or .jsonl file")
+    import_parser.add_argument("source")
+    import_parser.add_argument("--tags", default="", help="tags to add to every imported snippet")
+    import_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                               help="language-guessing processes (default: %(default)s)")
+
+    export_parser = commands.add_parser("export", help="export snippets to a .jsonl file")
+    export_parser.add_argument("out")
+    export_parser.add_argument("--language", help="only snippets in this language")
+    export_parser.add_argument("--tag", help="only snippets with this tag")
+    export_parser.add_argument("--favorites", action="store_true", help="only favorite snippets")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    db.DB_FILE = args.db
+    db.initialize_db()
+    last_report = 0.0
+
+    def report(done, verb, seconds):
+        nonlocal last_report
+        if seconds - last_report >= REPORT_INTERVAL:
+            last_report = seconds
+            print(f"  {done} {verb}, {done / seconds:.0f} rows/s")
+
+    start = time.perf_counter()
+    try:
+        if args.command == "import":
+            counts = import_snippets(args.source, args.tags, args.workers,
+                                     progress=lambda counts, seconds: report(counts['imported'], "imported", seconds))
+            done = counts['imported']
+            summary = f"{done} imported, {counts['duplicates']} duplicates, {counts['skipped']} skipped"
+        else:
+            done = export_snippets(args.out, args.language, args.tag, args.favorites,
+                                   progress=lambda count, seconds: report(count, "exported", seconds))
+            summary = f"{done} exported to {args.out}"
+    finally:
+        db.close_db()
+    elapsed = time.perf_counter() - start
+    print(f"{summary} in {elapsed:.1f} s ({done / elapsed if elapsed else 0.0:.0f} rows/s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+# codesnap/core/encoders.py
+
+import io
+import os
+from PIL import Image
+from .image_generator import ExportCancelled
+
+# Export formats: name -> (Pillow format, file extension, can be lossless, can be lossy)
+EXPORT_FORMATS = {
+    'PNG': ('PNG', '.png', True, False),
+    'WebP': ('WEBP', '.webp', True, True),
+    # Only offered when a JPEG XL plugin (e.g. pillow-jxl-plugin) is installed
+    'JPEG XL': ('JXL', '.jxl', True, True),
+}
+DEFAULT_PNG_COMPRESS_LEVEL = 6
+DEFAULT_QUALITY = 90
+
+
+def available_formats():
+    """Names of the EXPORT_FORMATS this Pillow build can write."""
+    Image.init()
+    return [name for name, (pil_format, *_) in EXPORT_FORMATS.items() if pil_format in Image.SAVE]
+
+
+def save_options(format_name, compress_level=DEFAULT_PNG_COMPRESS_LEVEL, optimize=False,
+                 lossless=True, quality=DEFAULT_QUALITY):
+    """Pillow save() keyword arguments for an export format and its settings."""
+    if format_name == 'PNG':
+        return {'compress_level': compress_level, 'optimize': optimize}
+    if lossless:
+        return {'lossless': True}
+    return {'quality': quality}
+
+
+def encode_image(image, format_name, **settings):
+    """Encodes `image` in one of the EXPORT_FORMATS and returns the file's bytes."""
+    buffer = io.BytesIO()
+    image.save(buffer, EXPORT_FORMATS[format_name][0], **save_options(format_name, **settings))
+    return buffer.getvalue()
+
+
+def save_image(image, path, format_name, cancel_event=None, **settings):
+    """
+    Encodes `image` to `path` in one of the EXPORT_FORMATS.
+
+    The file is written under a temporary name and moved into place at the
+    end, so a failed or abandoned export never leaves a partial file behind.
+    Encoding can't be interrupted, but if `cancel_event` is set by the time
+    it finishes, the result is dropped and ExportCancelled raised.
+    """
+    pil_format = EXPORT_FORMATS[format_name][0]
+    tmp = f"{path}.part"
+    try:
+        image.save(tmp, pil_format, **save_options(format_name, **settings))
+        if cancel_event is not None and cancel_event.is_set():
+            raise ExportCancelled()
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
@@ -0,0 +1,94 @@
+# codesnap/core/fonts.py
+
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from PIL import Image, ImageDraw
+from pygments.formatters.img import FontManager
+
+# Loaded fonts kept, keyed by (font name or path, size)
+FONT_CACHE_SIZE = 16
+# Rasterized glyphs kept across renders
+GLYPH_CACHE_SIZE = 8192
+
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def _load_fonts(font_name, font_size, stamp):
+    fonts = FontManager(font_name, font_size)
+    # Identifies these exact fonts in the glyph atlas
+    fonts.cache_key = (font_name, font_size, stamp)
+    return fonts
+
+
+def get_fonts(font_name, font_size):
+    """
+    Returns a (shared) Pygments FontManager for a font file path or name.
+
+    Its get_font(bold, italic) gives the FreeTypeFont of each variant, so the
+    TTF is opened once per (font, size) rather than once per export. A font
+    file that changes on disk is loaded afresh.
+    """
+    stamp = None
+    if os.path.isfile(font_name):
+        stat = os.stat(font_name)
+        stamp = (stat.st_size, stat.st_mtime_ns)
+    return _load_fonts(font_name, font_size, stamp)
+
+
+class GlyphAtlas:
+    """
+    LRU cache of rasterized glyphs, keyed by (font, size, variant, character).
+
+    Each entry is the glyph's 8-bit coverage mask with its offset from the pen
+    position, and the advance to the next character. Masks are colourless: the
+    renderer fills through them with the token colour, so one entry serves
+    every theme.
+    """
+    def __init__(self, size=GLYPH_CACHE_SIZE):
+        self.size = size
+        self._glyphs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def glyph(self, fonts, bold, italic, char):
+        """Returns (mask or None for blank glyphs, dx, dy, advance)."""
+        key = (fonts.cache_key, bold, italic, char)
+        with self._lock:
+            glyph = self._glyphs.get(key)
+            if glyph is not None:
+                self._glyphs.move_to_end(key)
+                return glyph
+            # Variable fonts switch variant on the shared font object, so
+            # rasterize under the lock too
+            font = fonts.get_font(bold, italic)
+            left, top, right, bottom = font.getbbox(char)
+            mask = None
+            if right > left and bottom > top:
+                mask = Image.new('L', (right - left, bottom - top))
+                ImageDraw.Draw(mask).text((-left, -top), char, font=font, fill=255)
+                if not mask.getbbox():
+                    mask = None
+            glyph = self._glyphs[key] = (mask, left, top, font.getlength(char))
+            if len(self._glyphs) > self.size:
+                self._glyphs.popitem(last=False)
+            return glyph
+
+    # Measuring text also switches the variant of variable fonts, so it goes
+    # through the atlas as well, under the same lock
+    def char_size(self, fonts):
+        """Returns fonts.get_char_size(): the (width, height) of the regular 'M'."""
+        with self._lock:
+            return fonts.get_char_size()
+
+    def text_bbox(self, fonts, bold, italic, text):
+        """Returns the bounding box of `text` drawn in the given variant."""
+        with self._lock:
+            return fonts.get_font(bold, italic).getbbox(text)
+
+    def clear(self):
+        with self._lock:
+            self._glyphs.clear()
+
+
+# Shared by every render in the process
+glyph_atlas = GlyphAtlas()
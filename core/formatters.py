@@ -0,0 +1,147 @@
+# codesnap/core/formatters.py
+
+import hashlib
+import threading
+from collections import OrderedDict
+from .process_pool import spawn_context
+
+# Give up on (and restart) the formatter process after this many seconds
+FORMAT_TIMEOUT = 10.0
+FORMAT_CACHE_SIZE = 256
+JSBEAUTIFIER_LANGUAGES = ('javascript', 'html', 'css')
+
+_format_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_process = None
+_connection = None
+_process_lock = threading.Lock()
+
+
+class FormatError(Exception):
+    """Raised when code can't be formatted; the message is meant for the status bar."""
+
+
+def _format_python(code, language):
+    try:
+        import black
+    except ImportError:
+        raise FormatError("'black' is not installed.")
+    try:
+        return black.format_str(code, mode=black.Mode())
+    except black.InvalidInput:
+        raise FormatError("Black formatter failed: Code may have a syntax error.")
+
+
+def _format_jsbeautifier(code, language):
+    import jsbeautifier
+    opts = jsbeautifier.default_options()
+    opts.indent_size = 2
+    opts.preserve_newlines = True
+    opts.max_preserve_newlines = 2
+    opts.wrap_line_length = 100
+    if language == 'javascript':
+        return jsbeautifier.beautify(code, opts)
+    if language == 'html':
+        return jsbeautifier.beautify_html(code, opts)
+    return jsbeautifier.beautify_css(code, opts)
+
+
+# language -> function(code, language) returning the formatted code
+FORMATTERS = {'python': _format_python}
+FORMATTERS.update((language, _format_jsbeautifier) for language in JSBEAUTIFIER_LANGUAGES)
+
+
+def can_format(language):
+    return language in FORMATTERS
+
+
+def _serve(connection):
+    """The formatter process: formats (language, code) requests until sent None."""
+    # Import the formatters up front, so the first request doesn't wait for them
+    for module in ('black', 'jsbeautifier'):
+        try:
+            __import__(module)
+        except ImportError:
+            pass
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        language, code = request
+        try:
+            connection.send((True, FORMATTERS[language](code, language)))
+        except FormatError as e:
+            connection.send((False, str(e)))
+        except Exception as e:
+            connection.send((False, f"An error occurred during formatting: {e}"))
+
+
+def _run_in_process(language, code, timeout):
+    global _process, _connection
+    with _process_lock:
+        if _process is None or not _process.is_alive():
+            context = spawn_context()
+            _connection, child = context.Pipe()
+            _process = context.Process(target=_serve, args=(child,), daemon=True)
+            _process.start()
+            child.close()
+        try:
+            _connection.send((language, code))
+            if not _connection.poll(timeout):
+                # A formatter stuck on pathological input: kill it, the next
+                # request starts a fresh one
+                _process.kill()
+                _process.join()
+                _process = None
+                raise FormatError(f"Formatting took longer than {timeout:g} s and was stopped.")
+            ok, result = _connection.recv()
+        except (EOFError, OSError):
+            _process = None
+            raise FormatError("The formatter process stopped unexpectedly.")
+    if not ok:
+        raise FormatError(result)
+    return result
+
+
+def format_code(code, language, timeout=FORMAT_TIMEOUT):
+    """
+    Formats code with black (python) or jsbeautifier (javascript, html, css).
+
+    Formatting happens in one long-lived formatter process, started on first
+    use, so each call costs neither interpreter start-up nor formatter
+    imports, and a formatter that hangs can be killed after `timeout`
+    seconds. Results are memoized by a hash of the code. Blocks until done,
+    so call this off the GUI thread. Raises FormatError.
+    """
+    if not can_format(language):
+        raise FormatError(f"No prettifier available for '{language}'.")
+    key = (language, hashlib.sha1(code.encode('utf-8', 'surrogatepass')).digest())
+    with _cache_lock:
+        formatted = _format_cache.get(key)
+        if formatted is not None:
+            _format_cache.move_to_end(key)
+            return formatted
+    formatted = _run_in_process(language, code, timeout)
+    with _cache_lock:
+        _format_cache[key] = formatted
+        if len(_format_cache) > FORMAT_CACHE_SIZE:
+            _format_cache.popitem(last=False)
+    return formatted
+
+
+def shutdown_formatter():
+    global _process, _connection
+    with _process_lock:
+        if _process is not None:
+            try:
+                _connection.send(None)
+            except OSError:
+                pass
+            _process.join(1)
+            if _process.is_alive():
+                _process.kill()
+            _process = None
+            _connection = None
@@ -1,53 +1,351 @@
 # codesnap/core/image_generator.py
 
-from PIL import Image, ImageDraw, ImageFont
-from pygments import highlight
-from pygments.lexers import get_lexer_by_name
-# This is the final corrected import:
-from pygments.formatters.img import ImageFormatter
-from pygments.styles import get_style_by_name
-import io
+import os
+from itertools import islice
+from PIL import Image, ImageColor, ImageDraw
+from pygments.token import string_to_tokentype
+from .fonts import get_fonts, glyph_atlas
+from .lexers import get_lexer
+from .png_writer import PngStreamWriter
+from .process_pool import LazyProcessPool
+from .themes import get_theme
 
+# Layout, matching what Pygments' ImageFormatter used to produce for us
+IMAGE_PAD = 10           # between the code and the edge of the code area
+LINE_PAD = 2             # extra space between lines
+LINE_NUMBER_CHARS = 2
+LINE_NUMBER_PAD = 6
+LINE_NUMBER_FG = '#886'
+LINE_NUMBER_BG = '#eed'
+FRAME_PAD = 20           # background-colored frame around the code area, per side
+TAB_SIZE = 4
+# Lines per tile in export_png_tiled
+TILE_LINES = 256
+# generate_image reports progress every this many lines
+PROGRESS_LINES = 200
 
-def generate_image(code: str, language: str, style_name: str, font_name: str, font_size: int, line_numbers: bool):
+
+_render_pool = LazyProcessPool()
+
+
+class ExportCancelled(Exception):
+    """Raised by a progress callback to abandon a render."""
+
+
+def _iter_lines(code, lexer):
+    """Lexes code lazily, yielding each line as a list of (text, token type) runs."""
+    line = []
+    pending = False  # get_tokens always ends the code with a newline
+    for ttype, value in lexer.get_tokens(code):
+        parts = value.expandtabs(TAB_SIZE).split('\n')
+        for i, part in enumerate(parts):
+            if i:
+                yield line
+                line = []
+            if part:
+                line.append((part, ttype))
+        pending = bool(line)
+    if pending:
+        yield line
+
+
+def tokenize(code, language, max_lines=None):
+    """
+    Lexes code into lines of (text, token type) runs; with `max_lines`, only
+    (and only as far as) the first that many lines.
+
+    generate_image and export_png_tiled lex the code themselves unless they
+    are handed this list as `tokens`, so callers rendering the same code
+    several times (preview, then export) can lex it once.
+    """
+    return list(islice(_iter_lines(code, get_lexer(language, stripall=True)), max_lines))
+
+
+def _text_styles(theme):
+    """Returns a memoizing lookup of (bold, italic, fg, bg) per token type."""
+    resolved = {}
+
+    def lookup(ttype):
+        result = resolved.get(ttype)
+        if result is None:
+            color, bgcolor, bold, italic, _ = theme.style_for(ttype)
+            result = resolved[ttype] = (
+                bold,
+                italic,
+                ImageColor.getcolor(f"#{color}" if color else '#000', 'RGBA'),
+                f"#{bgcolor}" if bgcolor else None,
+            )
+        return result
+    return lookup
+
+
+def _draw_glyphs(image, fonts, x, y, text, bold, italic, fill):
+    """Blits `text` from the glyph atlas with its pen at (x, y); returns the end x."""
+    glyph = glyph_atlas.glyph
+    paste = image.paste
+    for char in text:
+        mask, dx, dy, advance = glyph(fonts, bold, italic, char)
+        if mask is not None:
+            left, top = int(x) + dx, int(y) + dy
+            paste(fill, (left, top, left + mask.size[0], top + mask.size[1]), mask)
+        x += advance
+    return x
+
+
+def _text_width(fonts, text, bold, italic):
+    glyph = glyph_atlas.glyph
+    return sum(glyph(fonts, bold, italic, char)[3] for char in text)
+
+
+class CodeRenderer:
+    """
+    Lays out and draws highlighted lines for one (style, font, size) setting.
+
+    `scale` renders the same picture at 2x, 3x, ... the pixel density: the
+    font size, paddings and rules all grow with it. All coordinates are those
+    of the final framed image; draw calls take a `top` offset so the image
+    can also be drawn as a stack of tiles.
+    """
+    def __init__(self, style_name, font_name, font_size, line_numbers, scale=1):
+        self.style = get_theme(style_name)
+        self.fonts = get_fonts(font_name, font_size * scale)
+        self.text_style = _text_styles(self.style)
+        self.line_numbers = line_numbers
+        self.scale = scale
+        self.image_pad = IMAGE_PAD * scale
+        self.frame_pad = FRAME_PAD * scale
+        self.number_pad = LINE_NUMBER_PAD * scale
+
+        char_width, char_height = glyph_atlas.char_size(self.fonts)
+        self.line_height = char_height + LINE_PAD * scale
+        self.gutter = char_width * LINE_NUMBER_CHARS + self.number_pad * 2 if line_numbers else 0
+        self.bg_color = self.style.background_color or "#272822" # Default to Monokai's background
+        self.number_fill = ImageColor.getcolor(LINE_NUMBER_FG, 'RGBA')
+        # The code area (what ImageFormatter drew) sits inside the frame
+        self.origin = self.frame_pad
+        self.text_x = self.origin + self.image_pad + self.gutter
+
+    def layout_line(self, runs):
+        """Returns ([(x, text, look), ...], width) for one line of runs."""
+        # Merge neighbouring runs drawn alike, so each line takes few draw calls
+        merged = []
+        for text, ttype in runs:
+            look = self.text_style(ttype)
+            if merged and merged[-1][1] is look:
+                merged[-1][0] += text
+            else:
+                merged.append([text, look])
+        x = 0
+        line = []
+        for text, look in merged:
+            line.append((x, text, look))
+            x += _text_width(self.fonts, text, look[0], look[1])
+        return line, x
+
+    def shape_line(self, runs):
+        """
+        Like layout_line, but independent of the style: returns
+        ([(x, text, token type), ...], width), measured with the regular
+        face. Code fonts give every weight the same advances, so one shaped
+        line serves every theme at this font size.
+        """
+        x = 0
+        line = []
+        for text, ttype in runs:
+            line.append((x, text, ttype))
+            x += _text_width(self.fonts, text, False, False)
+        return line, x
+
+    def style_line(self, shaped):
+        """Turns a shape_line line into a layout_line line for this style."""
+        text_style = self.text_style
+        return [(x, text, text_style(ttype)) for x, text, ttype in shaped]
+
+    def image_size(self, line_count, max_width):
+        self.code_width = int(max_width) + self.image_pad * 2 + self.gutter
+        self.code_height = line_count * self.line_height + self.image_pad * 2
+        return self.code_width + self.frame_pad * 2, self.code_height + self.frame_pad * 2
+
+    def line_top(self, lineno):
+        return self.origin + self.image_pad + lineno * self.line_height
+
+    def draw_background(self, image, top=0):
+        """Paints the code area and line-number gutter that fall within `image`."""
+        draw = ImageDraw.Draw(image)
+        origin, bottom = self.origin - top, self.origin + self.code_height - 1 - top
+        if self.style.background_color is None:
+            # ImageFormatter painted the code area white for such styles
+            draw.rectangle([(self.origin, origin), (self.origin + self.code_width - 1, bottom)], fill='#fff')
+        if self.line_numbers:
+            right = self.origin + self.image_pad + self.gutter - self.number_pad
+            draw.rectangle([(self.origin, origin), (right, bottom)], fill=LINE_NUMBER_BG)
+            draw.line([(right, origin), (right, bottom)], fill=LINE_NUMBER_FG, width=self.scale)
+
+    def draw_line(self, image, lineno, line, top=0):
+        y = self.line_top(lineno) - top
+        fonts = self.fonts
+        if self.line_numbers:
+            _draw_glyphs(image, fonts, self.origin + self.image_pad, y, str(lineno + 1).rjust(LINE_NUMBER_CHARS),
+                         False, False, self.number_fill)
+        for x, text, (bold, italic, fg, bg) in line:
+            if bg:
+                width, height = glyph_atlas.text_bbox(fonts, bold, italic, text)[2:]
+                ImageDraw.Draw(image).rectangle(
+                    [self.text_x + x, y, self.text_x + x + width, y + height], fill=bg)
+            _draw_glyphs(image, fonts, self.text_x + x, y, text, bold, italic, fg)
+
+
+def generate_image(code: str, language: str, style_name: str, font_name: str, font_size: int, line_numbers: bool,
+                   progress=None, tokens=None):
     """
-    Generates a PNG image of the code snippet using the new ImageFormatter.
+    Renders the code snippet to an RGBA image, framed by the style's background.
+
+    Tokens are drawn straight onto the final canvas: there is no intermediate
+    PNG to encode and decode, and no second image to paste into. Fonts are
+    loaded once per process and glyphs come from the shared glyph atlas, so
+    only characters never drawn before in that font and size get rasterized.
+
+    `progress(lines_done, line_count)` is called as lines are drawn; it may
+    raise ExportCancelled, which is passed on to the caller. `tokens` is the
+    code already lexed by tokenize().
     """
     try:
-        lexer = get_lexer_by_name(language, stripall=True)
-        style = get_style_by_name(style_name)
-
-        # Use the new ImageFormatter and specify the format as PNG
-        formatter = ImageFormatter(
-            image_format='PNG',
-            style=style,
-            font_face=font_name,
-            font_size=font_size,
-            line_numbers=line_numbers,
-            image_padding=20
-        )
-
-        # Highlight the code and get the image data
-        image_bytes = highlight(code, lexer, formatter)
-        
-        # Load the image from bytes
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # --- Add a custom background ---
-        bg_color = style.background_color or "#272822" # Default to Monokai's background
-        
-        # Calculate new image size with extra padding for the frame effect
-        final_padding = 40
-        new_size = (image.width + final_padding, image.height + final_padding)
-        
-        final_image = Image.new('RGBA', new_size, bg_color)
-        
-        # Paste the code image onto the background, centered
-        paste_position = (final_padding // 2, final_padding // 2)
-        final_image.paste(image, paste_position)
-        
-        return final_image
+        if tokens is None:
+            tokens = _iter_lines(code, get_lexer(language, stripall=True))
+        renderer = CodeRenderer(style_name, font_name, font_size, line_numbers)
+        lines = [renderer.layout_line(runs) for runs in tokens]
+        max_width = max((width for _, width in lines), default=0)
+
+        image = Image.new('RGBA', renderer.image_size(len(lines), max_width), renderer.bg_color)
+        renderer.draw_background(image)
+        for lineno, (line, _) in enumerate(lines):
+            if progress and lineno % PROGRESS_LINES == 0:
+                progress(lineno, len(lines))
+            renderer.draw_line(image, lineno, line)
+        if progress:
+            progress(len(lines), len(lines))
+        return image
 
+    except ExportCancelled:
+        raise
     except Exception as e:
         print(f"Error generating image: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+def _draw_variant(style_name, font_name, font_size, line_numbers, scale, shaped, max_width):
+    """Draws one render_variants variant from lines already shaped at its scale."""
+    renderer = CodeRenderer(style_name, font_name, font_size, line_numbers, scale)
+    image = Image.new('RGBA', renderer.image_size(len(shaped), max_width), renderer.bg_color)
+    renderer.draw_background(image)
+    for lineno, line in enumerate(shaped):
+        # Token types cross process boundaries as their names
+        line = [(x, text, string_to_tokentype(ttype) if isinstance(ttype, str) else ttype)
+                for x, text, ttype in line]
+        renderer.draw_line(image, lineno, renderer.style_line(line))
+    return image
+
+
+def shutdown_render_pool():
+    _render_pool.shutdown()
+
+
+def render_variants(code, language, styles, font_name, font_size, line_numbers, scales=(1,), tokens=None,
+                    parallel=True):
+    """
+    Renders the code in every combination of `styles` and `scales`.
+
+    The code is lexed once (or not at all, given `tokens`) and lines are
+    shaped once per scale; each variant then only has to be drawn. With
+    more than one variant (and more than one core) the drawing is spread
+    over a process pool.
+    Returns {(style_name, scale): image}.
+    """
+    if tokens is None:
+        tokens = tokenize(code, language)
+    shaped = {}
+    for scale in scales:
+        renderer = CodeRenderer(styles[0], font_name, font_size, line_numbers, scale)
+        lines = [renderer.shape_line(runs) for runs in tokens]
+        shaped[scale] = ([line for line, _ in lines], max((width for _, width in lines), default=0))
+
+    jobs = [(style_name, scale) for style_name in styles for scale in scales]
+    if not parallel or len(jobs) < 2 or (os.cpu_count() or 1) < 2:
+        return {
+            (style_name, scale): _draw_variant(style_name, font_name, font_size, line_numbers, scale, *shaped[scale])
+            for style_name, scale in jobs
+        }
+
+    portable = {
+        scale: ([[(x, text, str(ttype)) for x, text, ttype in line] for line in lines], max_width)
+        for scale, (lines, max_width) in shaped.items()
+    }
+    pool = _render_pool.get()
+    futures = {
+        (style_name, scale): pool.submit(_draw_variant, style_name, font_name, font_size, line_numbers,
+                                         scale, *portable[scale])
+        for style_name, scale in jobs
+    }
+    return {job: future.result() for job, future in futures.items()}
+
+
+def export_png_tiled(code, language, style_name, font_name, font_size, line_numbers, path, tile_lines=TILE_LINES,
+                     compress_level=6, progress=None, tokens=None):
+    """
+    Writes the same image generate_image would make straight to a PNG file,
+    in bounded memory.
+
+    Unless given `tokens`, the code is lexed twice as a stream: once to
+    measure the widest line, then again to draw horizontal tiles of
+    `tile_lines` lines, each handed to a streaming PNG encoder as soon as it
+    is drawn. Only one tile (and a line of lookahead) is in memory at a
+    time, however long the code is.
+    `progress` and `tokens` are as in generate_image. The file is only moved
+    into place once complete. Returns the (width, height) written.
+    """
+    def token_lines():
+        if tokens is not None:
+            return iter(tokens)
+        return _iter_lines(code, get_lexer(language, stripall=True))
+
+    renderer = CodeRenderer(style_name, font_name, font_size, line_numbers)
+    line_count = 0
+    max_width = 0
+    for runs in token_lines():
+        max_width = max(max_width, renderer.layout_line(runs)[1])
+        line_count += 1
+    width, height = renderer.image_size(line_count, max_width)
+
+    # Tile boundaries: the first tile also holds the top padding, the last
+    # one the bottom padding
+    bounds = [0] + [renderer.line_top(n) for n in range(tile_lines, line_count, tile_lines)] + [height]
+    lines = enumerate(renderer.layout_line(runs)[0] for runs in token_lines())
+    tmp = f"{path}.part"
+    try:
+        with open(tmp, 'wb') as f:
+            _write_tiles(f, renderer, lines, bounds, width, height, line_count, compress_level, progress)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return width, height
+
+
+def _write_tiles(f, renderer, lines, bounds, width, height, line_count, compress_level, progress):
+    writer = PngStreamWriter(f, width, height, compress_level)
+    previous = None  # glyphs may reach into the neighbouring lines' rows
+    upcoming = next(lines, None)
+    for top, bottom in zip(bounds, bounds[1:]):
+        tile = Image.new('RGBA', (width, bottom - top), renderer.bg_color)
+        renderer.draw_background(tile, top)
+        if previous is not None:
+            renderer.draw_line(tile, *previous, top=top)
+        while upcoming is not None and renderer.line_top(upcoming[0]) < bottom:
+            renderer.draw_line(tile, *upcoming, top=top)
+            previous, upcoming = upcoming, next(lines, None)
+        if upcoming is not None:
+            renderer.draw_line(tile, *upcoming, top=top)
+        writer.write_rows(tile)
+        if progress:
+            progress(upcoming[0] if upcoming is not None else line_count, line_count)
+    writer.close()
@@ -0,0 +1,65 @@
+# codesnap/core/lexers.py
+
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from pygments.lexers import get_lexer_by_name, guess_lexer
+from pygments.util import ClassNotFound
+
+# Lexer instances kept, keyed by (name, options)
+LEXER_CACHE_SIZE = 32
+# Language guesses are made from (and memoized by) the start of the code
+GUESS_SAMPLE_CHARS = 4096
+GUESS_CACHE_SIZE = 1024
+
+_guess_cache = OrderedDict()
+_guess_lock = threading.Lock()
+
+
+@lru_cache(maxsize=LEXER_CACHE_SIZE)
+def _cached_lexer(name, options):
+    return get_lexer_by_name(name, **dict(options))
+
+
+def get_lexer(name, **options):
+    """
+    Cached get_lexer_by_name, shared by the editor and the image exporter.
+
+    Lexers don't keep state between get_tokens calls, so one instance per
+    (name, options) is safe to reuse, from any thread. Raises ClassNotFound
+    like get_lexer_by_name.
+    """
+    return _cached_lexer(name, tuple(sorted(options.items())))
+
+
+def guess_language(code, languages):
+    """
+    Guesses which of `languages` (lexer aliases) `code` is written in.
+
+    Runs guess_lexer on the first GUESS_SAMPLE_CHARS characters; guesses are
+    memoized by a hash of that sample. Returns None when the guess isn't one
+    of `languages`. guess_lexer tries every Pygments lexer, so call this off
+    the GUI thread.
+    """
+    sample = code[:GUESS_SAMPLE_CHARS]
+    if not sample.strip():
+        return None
+    key = hashlib.sha1(sample.encode('utf-8', 'surrogatepass')).digest()
+    with _guess_lock:
+        aliases = _guess_cache.get(key)
+        if aliases is not None:
+            _guess_cache.move_to_end(key)
+    if aliases is None:
+        try:
+            aliases = tuple(guess_lexer(sample).aliases)
+        except ClassNotFound:
+            aliases = ()
+        with _guess_lock:
+            _guess_cache[key] = aliases
+            if len(_guess_cache) > GUESS_CACHE_SIZE:
+                _guess_cache.popitem(last=False)
+    for alias in aliases:
+        if alias in languages:
+            return alias
+    return None
@@ -0,0 +1,70 @@
+# codesnap/core/png_writer.py
+
+import struct
+import zlib
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Compressed data is flushed to the file in IDAT chunks of about this size
+IDAT_CHUNK_BYTES = 256 * 1024
+
+
+class PngStreamWriter:
+    """
+    Writes an 8-bit RGBA PNG to a file row band by row band.
+
+    Pillow can only encode a whole image at once; this writer lets an image
+    whose height is known up front be produced as a series of tiles, so only
+    one tile ever needs to be in memory.
+    """
+    def __init__(self, f, width, height, compress_level=6):
+        self.f = f
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(compress_level)
+        self._pending = []
+        self._pending_bytes = 0
+        f.write(PNG_SIGNATURE)
+        # bit depth 8, colour type 6 (RGBA), default compression/filter, no interlace
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))
+
+    def write_rows(self, image):
+        """Appends the rows of an RGBA image exactly `width` pixels wide."""
+        if image.mode != 'RGBA' or image.width != self.width:
+            raise ValueError(f"expected an RGBA image {self.width} pixels wide")
+        if self.rows_written + image.height > self.height:
+            raise ValueError("more rows than the image height")
+        data = memoryview(image.tobytes())
+        stride = self.width * 4
+        compress = self._compressor.compress
+        for i in range(0, len(data), stride):
+            # Every scanline starts with its filter type; 0 is no filter
+            self._add(compress(b'\x00'))
+            self._add(compress(data[i:i + stride]))
+        self.rows_written += image.height
+
+    def close(self):
+        if self.rows_written != self.height:
+            raise ValueError(f"wrote {self.rows_written} of {self.height} rows")
+        self._add(self._compressor.flush())
+        self._flush()
+        self._chunk(b'IEND', b'')
+
+    def _add(self, data):
+        if data:
+            self._pending.append(data)
+            self._pending_bytes += len(data)
+            if self._pending_bytes >= IDAT_CHUNK_BYTES:
+                self._flush()
+
+    def _flush(self):
+        if self._pending:
+            self._chunk(b'IDAT', b''.join(self._pending))
+            self._pending = []
+            self._pending_bytes = 0
+
+    def _chunk(self, kind, data):
+        self.f.write(struct.pack('>I', len(data)))
+        self.f.write(kind)
+        self.f.write(data)
+        self.f.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(kind))))
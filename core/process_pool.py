@@ -0,0 +1,37 @@
+# codesnap/core/process_pool.py
+
+import threading
+
+
+def spawn_context():
+    """
+    The multiprocessing context for every worker process the app starts:
+    spawn, not fork, since the GUI process has Qt and worker threads running.
+    """
+    # Imported on first use, to keep it out of application start-up
+    import multiprocessing
+    return multiprocessing.get_context("spawn")
+
+
+class LazyProcessPool:
+    """
+    A ProcessPoolExecutor of spawned workers, started on first get() and
+    shared by every caller until shutdown(); the next get() starts a new one.
+    """
+    def __init__(self):
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._pool is None:
+                from concurrent.futures import ProcessPoolExecutor
+                self._pool = ProcessPoolExecutor(mp_context=spawn_context())
+            return self._pool
+
+    def shutdown(self):
+        """Stops the workers, cancelling work not yet started."""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
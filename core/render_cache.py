@@ -0,0 +1,191 @@
+# codesnap/core/render_cache.py
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from PIL import Image
+import database_manager as db
+from . import image_generator
+from .image_generator import generate_image
+
+# Bump when the renderer's output changes, so old cache entries stop matching
+RENDER_VERSION = 1
+# Decoded images kept in memory, by their pixel size (RGBA: 4 bytes a pixel)
+MEMORY_CACHE_BYTES = 64 * 1024 * 1024
+# PNG files kept on disk; the least recently used go first
+DISK_CACHE_BYTES = 256 * 1024 * 1024
+
+_font_digests = {}
+_render_cache = None
+_render_cache_lock = threading.Lock()
+
+
+def _file_digest(path):
+    """sha1 of a font file, recomputed only when its size or mtime changes."""
+    if not os.path.isfile(path):
+        return path  # a font name Pygments looks up; nothing to digest
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    digest = _font_digests.get(key)
+    if digest is None:
+        with open(path, 'rb') as f:
+            digest = _font_digests[key] = hashlib.sha1(f.read()).hexdigest()
+    return digest
+
+
+def render_key(code, language, style_name, font_name, font_size, line_numbers):
+    """
+    Content address of a render: changing the code, the settings or the font
+    file yields a different key, so stale entries are never returned.
+    """
+    parts = (
+        RENDER_VERSION, code, language, style_name, _file_digest(font_name),
+        font_size, bool(line_numbers),
+        image_generator.IMAGE_PAD, image_generator.LINE_PAD, image_generator.FRAME_PAD,
+    )
+    return hashlib.sha256(repr(parts).encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+class RenderCache:
+    """
+    Two-tier cache of exported images: an in-memory LRU of decoded images
+    in front of a directory of PNGs, each bounded by size.
+
+    Keys are content addresses (render_key), so there is nothing to
+    invalidate by hand: an edited snippet or a replaced font simply stops
+    hitting its old entries, which then age out.
+    """
+    def __init__(self, directory, memory_bytes=MEMORY_CACHE_BYTES, disk_bytes=DISK_CACHE_BYTES):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._images = OrderedDict()
+        self._memory_used = 0
+        self._disk_used = None  # scanned on first write
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'memory_entries': len(self._images),
+                'memory_bytes': self._memory_used,
+            }
+
+    def render(self, code, language, style_name, font_name, font_size, line_numbers, progress=None, tokens=None):
+        """generate_image, answered from the cache when possible. Returns a copy."""
+        key = render_key(code, language, style_name, font_name, font_size, line_numbers)
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                self.memory_hits += 1
+                return image.copy()
+
+        image = self._load(key)
+        if image is not None:
+            with self._lock:
+                self.disk_hits += 1
+            self._remember(key, image)
+            return image.copy()
+
+        with self._lock:
+            self.misses += 1
+        image = generate_image(code, language, style_name, font_name, font_size, line_numbers, progress, tokens)
+        if image is not None:
+            self._remember(key, image)
+            self._store(key, image)
+            image = image.copy()
+        return image
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self._memory_used = 0
+            for path, _, _ in self._disk_entries():
+                os.remove(path)
+            self._disk_used = 0
+
+    # --- Memory tier ---
+
+    def _remember(self, key, image):
+        size = image.width * image.height * 4
+        if size > self.memory_bytes:
+            return
+        with self._lock:
+            if key in self._images:
+                return
+            self._images[key] = image
+            self._memory_used += size
+            while self._memory_used > self.memory_bytes:
+                _, old = self._images.popitem(last=False)
+                self._memory_used -= old.width * old.height * 4
+
+    # --- Disk tier ---
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.png")
+
+    def _load(self, key):
+        path = self._path(key)
+        try:
+            with Image.open(path) as f:
+                image = f.copy()  # reads the pixels before the file closes
+            os.utime(path)  # mark as recently used
+            return image
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, key, image):
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            # Fast compression: the entry is a cache, not the exported file
+            image.save(tmp, 'PNG', compress_level=1)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Error writing render cache: {e}")
+            return
+        with self._lock:
+            if self._disk_used is None:
+                self._disk_used = sum(size for _, size, _ in self._disk_entries())
+            else:
+                self._disk_used += os.path.getsize(path)
+            if self._disk_used > self.disk_bytes:
+                self._evict_disk()
+
+    def _disk_entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.png'):
+                stat = entry.stat()
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict_disk(self):
+        entries = sorted(self._disk_entries(), key=lambda entry: entry[2])
+        self._disk_used = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if self._disk_used <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+                self._disk_used -= size
+            except OSError:
+                pass
+
+
+def get_render_cache():
+    """The process-wide RenderCache, kept next to the snippet database."""
+    global _render_cache
+    with _render_cache_lock:
+        if _render_cache is None:
+            _render_cache = RenderCache(os.path.join(os.path.dirname(db.DB_FILE), "render_cache"))
+        return _render_cache
@@ -1,66 +1,307 @@
 # codesnap/core/syntax_highlighter.py
 
+from collections import OrderedDict
 from PyQt6.QtGui import QSyntaxHighlighter, QTextCharFormat, QColor, QFont
-from pygments import highlight
-from pygments.lexers import get_lexer_by_name
-# This is the corrected line:
-from pygments.formatter import Formatter 
-from pygments.styles import get_style_by_name
-
-class PygmentsFormatter(Formatter):
-    """A custom Pygments formatter to interface with QSyntaxHighlighter."""
-    def __init__(self):
-        super().__init__()
-        self.data = []
-
-    def format(self, tokensource, outfile):
-        # outfile is not used in this implementation
-        self.data.clear()
-        for ttype, value in tokensource:
-            self.data.append((ttype, value))
+from pygments.lexer import RegexLexer, ExtendedRegexLexer, LexerContext
+from pygments.token import Error, Whitespace, _TokenType
+from .lexers import get_lexer
+from .themes import get_theme
+
+ROOT_STATE = ('root',)
+
+# Some lexers match a whole block comment or string with one regex, so a line
+# that opens one doesn't end in a lexer state. Lines are lexed with these
+# closing delimiters after them: a match that runs into them would continue
+# on the next line, which is then lexed together with this one.
+UNTERMINATED_PROBE = '\x00*/-->]]>?>%>"""\'\'\'`</script></style>'
+
+# Lines lexed together at most while a token stays open; past that the next
+# line starts afresh, as if the token had ended
+MAX_PENDING_LINES = 100
+
+# Lexed lines kept per highlighter, keyed by (text lexed, starting state)
+LINE_CACHE_SIZE = 4096
+
+# Shared by every highlighter, one per Pygments style name (see format_table)
+_format_tables = {}
+
+
+def _lex_regex(lexer, text, stack, limit=None):
+    """
+    RegexLexer.get_tokens_unprocessed, but starting from `stack` and also
+    returning the state stack reached at the end of `text`. With `limit`, it
+    stops at the first match reaching that offset instead, and also returns
+    whether that match ran past it.
+    """
+    tokens = []
+    crossed = False
+    pos = 0
+    tokendefs = lexer._tokens
+    statestack = list(stack)
+    statetokens = tokendefs[statestack[-1]]
+    while limit is None or pos < limit:
+        for rexmatch, action, new_state in statetokens:
+            m = rexmatch(text, pos)
+            if m:
+                if limit is not None and m.end() > limit:
+                    crossed = True
+                if action is not None:
+                    if type(action) is _TokenType:
+                        tokens.append((pos, action, m.group()))
+                    else:
+                        tokens.extend(action(lexer, m))
+                pos = m.end()
+                if new_state is not None:
+                    if isinstance(new_state, tuple):
+                        for state in new_state:
+                            if state == '#pop':
+                                if len(statestack) > 1:
+                                    statestack.pop()
+                            elif state == '#push':
+                                statestack.append(statestack[-1])
+                            else:
+                                statestack.append(state)
+                    elif isinstance(new_state, int):
+                        if abs(new_state) >= len(statestack):
+                            del statestack[1:]
+                        else:
+                            del statestack[new_state:]
+                    elif new_state == '#push':
+                        statestack.append(statestack[-1])
+                    statetokens = tokendefs[statestack[-1]]
+                break
+        else:
+            try:
+                if text[pos] == '\n':
+                    statestack = ['root']
+                    statetokens = tokendefs['root']
+                    tokens.append((pos, Whitespace, '\n'))
+                    pos += 1
+                    continue
+                tokens.append((pos, Error, text[pos]))
+                pos += 1
+            except IndexError:
+                break
+    return tokens, tuple(statestack), crossed
+
+
+def _lex(lexer, source, stack):
+    """Returns the tokens of `source` lexed from state `stack`, and the stack at its end."""
+    if isinstance(lexer, ExtendedRegexLexer):
+        ctx = LexerContext(source, 0, stack=list(stack))
+        tokens = list(lexer.get_tokens_unprocessed(context=ctx))
+        return tokens, tuple(ctx.stack)
+    if isinstance(lexer, RegexLexer):
+        tokens, end_stack, _ = _lex_regex(lexer, source, stack)
+        return tokens, end_stack
+    return list(lexer.get_tokens_unprocessed(source)), ROOT_STATE
+
+
+def lex_line(lexer, text, stack=ROOT_STATE, context=""):
+    """
+    Lexes one line starting in lexer state `stack`. `context` is the text of
+    the lines before it (each with its newline) still inside an open token;
+    it is lexed first, from `stack`, and the line continues where it ends.
+
+    Returns ((start, length, token type), ...) for the line, the state stack
+    to resume from on the next line, and whether the line ends inside a token
+    (see UNTERMINATED_PROBE). Lexers without a state stack always resume from
+    the root state.
+    """
+    # Rules often rely on the newline (end of comments, strings, ...)
+    source = context + text + "\n"
+    if isinstance(lexer, RegexLexer) and not isinstance(lexer, ExtendedRegexLexer):
+        # One pass: the probe follows the line, and lexing stops where it ends
+        tokens, end_stack, unterminated = _lex_regex(
+            lexer, source + UNTERMINATED_PROBE, stack, len(source))
+    else:
+        tokens, end_stack = _lex(lexer, source, stack)
+        unterminated = False
+        if isinstance(lexer, ExtendedRegexLexer):
+            probe, _ = _lex(lexer, source + UNTERMINATED_PROBE, stack)
+            if any(start < len(source) < start + len(value) for start, _, value in probe):
+                # Style the line as it will be once the token is closed
+                tokens, unterminated = probe, True
+
+    runs = []
+    offset = len(context)
+    limit = len(source) - 1
+    for start, ttype, value in tokens:
+        end = min(start + len(value), limit)
+        if end <= offset:
+            continue
+        if start >= limit:
+            break
+        start = max(start, offset)
+        runs.append((start - offset, end - start, ttype))
+    return tuple(runs), end_stack, unterminated
+
+
+class LineLexer:
+    """
+    Lexes a document line by line for a highlighter.
+
+    The state a line starts in is a lexer state stack plus the number of
+    lines before it that end inside an open token and are lexed again with
+    it. States are interned as small ints (usable as Qt block states), and
+    lexed lines are cached by (text lexed, start state).
+    """
+    def __init__(self, language='python'):
+        self.lexer = None
+        self.set_language(language)
+
+    def set_language(self, language):
+        """Switches lexer; returns False if `language` maps to the current one."""
+        try:
+            lexer = get_lexer(language)
+        except:
+            lexer = get_lexer('text') # Fallback
+        if lexer is self.lexer:
+            return False  # the cached lexer, states and lines stay valid
+        self.lexer = lexer
+        self._states = [(ROOT_STATE, 0)]
+        self._state_ids = {(ROOT_STATE, 0): 0}
+        self._line_cache = OrderedDict()
+        return True
+
+    def _state_id(self, state):
+        state_id = self._state_ids.get(state)
+        if state_id is None:
+            state_id = self._state_ids[state] = len(self._states)
+            self._states.append(state)
+        return state_id
+
+    def previous_lines(self, block, state_id):
+        """Texts of the blocks before QTextBlock `block` that lex() needs for `state_id`."""
+        lines = []
+        for _ in range(self._states[state_id][1]):
+            block = block.previous()
+            if not block.isValid():
+                break
+            lines.append(block.text())
+        lines.reverse()
+        return lines
+
+    def lex(self, text, state_id=0, previous=()):
+        """
+        Returns (runs, end state id) for a line starting in state `state_id`.
+        `previous` holds the texts of the lines before it that the state
+        carries an open token from (see previous_lines).
+        """
+        stack, pending = self._states[state_id]
+        context = "".join(line + "\n" for line in previous)
+        key = (context + text, state_id)
+        cached = self._line_cache.get(key)
+        if cached is not None:
+            self._line_cache.move_to_end(key)
+            return cached
+        runs, end_stack, unterminated = lex_line(self.lexer, text, stack, context)
+        if unterminated and pending < MAX_PENDING_LINES:
+            # The next line is lexed from the same start, this line included
+            end_state = (stack, pending + 1)
+        else:
+            end_state = (end_stack, 0)
+        cached = self._line_cache[key] = (runs, self._state_id(end_state))
+        if len(self._line_cache) > LINE_CACHE_SIZE:
+            self._line_cache.popitem(last=False)
+        return cached
+
+
+class FormatTable:
+    """
+    QTextCharFormats for one Pygments style, built lazily per token type.
+
+    A token type the style doesn't define takes the format of its closest
+    styled parent (Name.Function.Magic -> Name.Function), and the answer is
+    memoized, so every lookup after the first is a single dict hit.
+    """
+    def __init__(self, style_name):
+        self.style = get_theme(style_name)
+        self.default = QTextCharFormat()
+        self._formats = {}
+        self._by_style = {(None, None, False, False, False): self.default}
+
+    def format_for(self, ttype):
+        fmt = self._formats.get(ttype)
+        if fmt is None:
+            fmt = self._formats[ttype] = self._build(ttype)
+        return fmt
+
+    def _build(self, ttype):
+        key = self.style.style_for(ttype)
+        # Token types that end up styled alike share one format object
+        fmt = self._by_style.get(key)
+        if fmt is not None:
+            return fmt
+        color, bgcolor, bold, italic, underline = key
+        fmt = self._by_style[key] = QTextCharFormat()
+        if color:
+            fmt.setForeground(QColor(f"#{color}"))
+        if bgcolor:
+            fmt.setBackground(QColor(f"#{bgcolor}"))
+        if bold:
+            fmt.setFontWeight(QFont.Weight.Bold)
+        if italic:
+            fmt.setFontItalic(True)
+        if underline:
+            fmt.setFontUnderline(True)
+        return fmt
+
+
+def format_table(style_name):
+    """Returns the process-wide FormatTable for `style_name`, creating it once."""
+    table = _format_tables.get(style_name)
+    if table is None:
+        table = _format_tables[style_name] = FormatTable(style_name)
+    return table
+
 
 class SyntaxHighlighter(QSyntaxHighlighter):
-    """QSyntaxHighlighter that uses Pygments to style text."""
+    """
+    QSyntaxHighlighter that uses Pygments to style text.
+
+    Lexing is incremental: each block stores the lexer state it ends in (as
+    the block state), and the next block resumes from it, so multi-line
+    strings and comments are highlighted correctly. After an edit Qt only
+    re-highlights the following blocks while their end state keeps changing,
+    and lines already lexed from the same state come from a cache.
+    """
     def __init__(self, parent, language='python', style='monokai'):
         super().__init__(parent)
-        self.formatter = PygmentsFormatter()
-        try:
-            self.lexer = get_lexer_by_name(language)
-        except:
-            self.lexer = get_lexer_by_name('text') # Fallback
-
-        self.style = get_style_by_name(style)
-        self.formats = {}
-        for token, s in self.style:
-            fmt = QTextCharFormat()
-            if s['color']:
-                fmt.setForeground(QColor(f"#{s['color']}"))
-            if s['bgcolor']:
-                fmt.setBackground(QColor(f"#{s['bgcolor']}"))
-            if s['bold']:
-                fmt.setFontWeight(QFont.Weight.Bold)
-            if s['italic']:
-                fmt.setFontItalic(True)
-            if s['underline']:
-                fmt.setFontUnderline(True)
-            self.formats[token] = fmt
+        self.line_lexer = LineLexer(language)
+
+        self.set_style(style, rehighlight=False)
+
+    @property
+    def lexer(self):
+        return self.line_lexer.lexer
 
     def set_language(self, language):
-        try:
-            self.lexer = get_lexer_by_name(language)
-        except:
-            self.lexer = get_lexer_by_name('text')
-        self.rehighlight()
+        changed = self.line_lexer.set_language(language)
+        if changed:
+            self.rehighlight()
+        return changed
+
+    def set_style(self, style, rehighlight=True):
+        """Switches to another Pygments style; its formats are shared and cached."""
+        self.style_name = style
+        self.format_table = format_table(style)
+        if rehighlight:
+            self.rehighlight()
+
+    @property
+    def style(self):
+        return self.format_table.style
+
+    def format_for(self, ttype):
+        return self.format_table.format_for(ttype)
 
     def highlightBlock(self, text):
-        if not text:
-            return
-        # The highlight function writes to the formatter's outfile,
-        # but our custom format method just populates self.formatter.data
-        highlight(text, self.lexer, self.formatter)
-        
-        start = 0
-        for ttype, value in self.formatter.data:
-            length = len(value)
-            self.setFormat(start, length, self.formats.get(ttype, QTextCharFormat()))
-            start += length
\ No newline at end of file
+        state = max(self.previousBlockState(), 0)
+        previous = self.line_lexer.previous_lines(self.currentBlock(), state)
+        runs, end_state = self.line_lexer.lex(text, state, previous)
+        format_for = self.format_table.format_for
+        for start, length, ttype in runs:
+            self.setFormat(start, length, format_for(ttype))
+        # A changed end state makes Qt carry on with the next block
+        self.setCurrentBlockState(end_state)
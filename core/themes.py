@@ -0,0 +1,125 @@
+# codesnap/core/themes.py
+
+import json
+import os
+import threading
+import pygments
+from pygments.token import string_to_tokentype
+from pygments.util import ClassNotFound
+
+# Bump when the catalog's layout changes, so old catalogs get rebuilt
+CATALOG_VERSION = 1
+CATALOG_NAME = "theme_catalog.json"
+
+_catalog = None
+_themes = {}
+_lock = threading.Lock()
+
+
+class Theme:
+    """
+    The colors of one Pygments style, resolved per token type.
+
+    Stands in for the Pygments style class: `style_for(ttype)` gives the
+    (color, bgcolor, bold, italic, underline) of the closest styled parent
+    of `ttype`, the way Pygments' formatters look styles up. Colors are hex
+    without the '#', or None.
+    """
+    def __init__(self, name, background_color, table):
+        self.name = name
+        self.background_color = background_color
+        self._table = table
+        self._resolved = {}
+
+    @classmethod
+    def from_style(cls, name, style):
+        table = {}
+        for ttype in style._styles:
+            s = style.style_for_token(ttype)
+            table[ttype] = (s['color'], s['bgcolor'], bool(s['bold']), bool(s['italic']), bool(s['underline']))
+        return cls(name, style.background_color, table)
+
+    def style_for(self, ttype):
+        result = self._resolved.get(ttype)
+        if result is None:
+            styled = ttype
+            while styled not in self._table and styled.parent is not None:
+                styled = styled.parent
+            result = self._resolved[ttype] = self._table.get(styled, (None, None, False, False, False))
+        return result
+
+
+def _catalog_path():
+    import database_manager as db
+    return os.path.join(os.path.dirname(db.DB_FILE), CATALOG_NAME)
+
+
+def _build_catalog():
+    """Imports every installed Pygments style once and tabulates its colors."""
+    from pygments.styles import get_all_styles, get_style_by_name
+    themes = {}
+    for name in sorted(get_all_styles()):
+        try:
+            theme = Theme.from_style(name, get_style_by_name(name))
+        except ClassNotFound:
+            continue
+        themes[name] = {
+            'background': theme.background_color,
+            'tokens': {str(ttype): list(look) for ttype, look in theme._table.items()},
+        }
+    return {'version': CATALOG_VERSION, 'pygments': pygments.__version__, 'themes': themes}
+
+
+def _load_catalog():
+    global _catalog
+    with _lock:
+        if _catalog is not None:
+            return _catalog
+        path = _catalog_path()
+        try:
+            with open(path, encoding='utf-8') as f:
+                catalog = json.load(f)
+            if catalog.get('version') != CATALOG_VERSION or catalog.get('pygments') != pygments.__version__:
+                catalog = None
+        except (OSError, ValueError):
+            catalog = None
+        if catalog is None:
+            catalog = _build_catalog()
+            try:
+                tmp = f"{path}.{os.getpid()}.part"  # workers may race to write it
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(catalog, f, separators=(',', ':'))
+                os.replace(tmp, path)
+            except OSError as e:
+                print(f"Could not save the theme catalog: {e}")
+        _catalog = catalog
+        return catalog
+
+
+def theme_names():
+    """Sorted names of the installed Pygments styles, without importing them."""
+    return list(_load_catalog()['themes'])
+
+
+def get_theme(name):
+    """
+    Returns the Theme for the Pygments style `name`, raising ClassNotFound
+    like get_style_by_name for unknown names.
+
+    Themes come from a catalog built once per Pygments version and saved next
+    to the database, so after the first run no style module is imported at
+    all. A style missing from the catalog (e.g. from a plugin installed
+    since) is loaded from Pygments directly.
+    """
+    theme = _themes.get(name)
+    if theme is not None:
+        return theme
+    entry = _load_catalog()['themes'].get(name)
+    if entry is not None:
+        table = {string_to_tokentype(ttype): tuple(look) for ttype, look in entry['tokens'].items()}
+        theme = Theme(name, entry['background'], table)
+    else:
+        from pygments.styles import get_style_by_name
+        theme = Theme.from_style(name, get_style_by_name(name))
+    with _lock:
+        return _themes.setdefault(name, theme)
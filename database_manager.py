@@ -1,19 +1,163 @@
 # codesnap/database_manager.py
 
+import hashlib
 import sqlite3
 import os
+import re
+import threading
+import zlib
+from collections import deque
+from contextlib import contextmanager
+from core.process_pool import LazyProcessPool
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
 
 DB_FILE = os.path.join("database", "snippets.db")
 os.makedirs(os.path.dirname(DB_FILE), exist_ok=True)
 
-def get_db_connection():
-    """Establishes a connection to the SQLite database."""
-    conn = sqlite3.connect(DB_FILE)
+# --- Connection management ---
+# Each thread gets one connection that stays open for the life of the app, so
+# list refreshes and search keystrokes don't pay for connect + schema parsing.
+# sqlite3 keeps a per-connection cache of prepared statements keyed by the SQL
+# text, so reusing the connection also reuses the compiled statements.
+STATEMENT_CACHE_SIZE = 256
+
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",       # readers no longer block the writer
+    "PRAGMA synchronous = NORMAL",     # safe with WAL, one fsync per checkpoint
+    "PRAGMA cache_size = -32000",      # 32 MB page cache (negative = KiB)
+    "PRAGMA mmap_size = 268435456",    # memory-map up to 256 MB of the file
+    "PRAGMA temp_store = MEMORY",
+)
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def _open_connection():
+    conn = sqlite3.connect(
+        DB_FILE,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        check_same_thread=False,  # only so close_db() can close it from the main thread
+    )
     conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    conn.create_function("code_hash", 1, code_hash, deterministic=True)
+    conn.create_function("code_text", 1, _unpack_code, deterministic=True)
+    return conn
+
+
+def code_hash(code):
+    """Content hash of a snippet's code: snippets.code_hash, and the key of its blob in code_blobs."""
+    return hashlib.sha256(code.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def get_db_connection():
+    """Returns the calling thread's SQLite connection, opening it on first use."""
+    thread_id = threading.get_ident()
+    conn = _connections.get(thread_id)
+    if conn is None:
+        conn = _open_connection()
+        with _connections_lock:
+            _connections[thread_id] = conn
     return conn
 
-def initialize_db():
-    """Initializes and upgrades the database schema if necessary."""
+
+class QueryCancelled(Exception):
+    """Raised inside a `cancellable()` block once its cancel event is set."""
+
+
+# Number of SQLite VM instructions between cancellation checks
+CANCEL_CHECK_INTERVAL = 10_000
+
+_cancel_state = threading.local()
+
+
+@contextmanager
+def cancellable(cancel_event):
+    """
+    Makes queries run by this thread inside the block abort as soon as
+    `cancel_event` (a threading.Event) is set, raising QueryCancelled.
+    """
+    conn = get_db_connection()
+    _cancel_state.event = cancel_event
+    conn.set_progress_handler(cancel_event.is_set, CANCEL_CHECK_INTERVAL)
+    try:
+        yield
+    except sqlite3.OperationalError as e:
+        if cancel_event.is_set():
+            raise QueryCancelled() from e
+        raise
+    finally:
+        conn.set_progress_handler(None, 0)
+        _cancel_state.event = None
+
+
+def _check_cancelled():
+    """Raises QueryCancelled if the enclosing `cancellable()` block was cancelled."""
+    event = getattr(_cancel_state, "event", None)
+    if event is not None and event.is_set():
+        raise QueryCancelled()
+
+
+def _close_connection(conn):
+    try:
+        conn.execute("PRAGMA optimize")
+        conn.close()
+    except sqlite3.Error as e:
+        print(f"Error closing database connection: {e}")
+
+
+def close_thread_connection():
+    """
+    Closes the calling thread's connection, if it has one. Call at the end of
+    work on a thread that is about to exit, so its connection (and page
+    cache) doesn't stay open until close_db.
+    """
+    with _connections_lock:
+        conn = _connections.pop(threading.get_ident(), None)
+    if conn is not None:
+        _close_connection(conn)
+
+
+def close_db():
+    """Closes every open connection. Call once when the application shuts down."""
+    _regex_pool.shutdown()
+    with _connections_lock:
+        connections = list(_connections.values())
+        _connections.clear()
+    for conn in connections:
+        _close_connection(conn)
+
+
+_upgrade_state = threading.local()
+
+
+def _report_upgrade(step):
+    """Prints an upgrade step and passes it to initialize_db's `progress` callback."""
+    print(f"Upgrading database: {step}")
+    progress = getattr(_upgrade_state, "progress", None)
+    if progress is not None:
+        progress(step)
+
+
+def initialize_db(progress=None):
+    """
+    Initializes and upgrades the database schema if necessary. Upgrades of a
+    large library take a while; `progress(step)` is called as each starts.
+    """
+    _upgrade_state.progress = progress
+    try:
+        _initialize_db()
+    finally:
+        _upgrade_state.progress = None
+
+
+def _initialize_db():
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -24,7 +168,7 @@ def initialize_db():
             title TEXT NOT NULL,
             language TEXT NOT NULL,
             tags TEXT,
-            code TEXT NOT NULL,
+            code_hash TEXT NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     """)
@@ -33,90 +177,836 @@ def initialize_db():
     cursor.execute("PRAGMA table_info(snippets)")
     columns = [column['name'] for column in cursor.fetchall()]
     if 'is_favorite' not in columns:
-        print("Upgrading database: Adding 'is_favorite' column...")
+        _report_upgrade("Adding 'is_favorite' column...")
         cursor.execute("ALTER TABLE snippets ADD COLUMN is_favorite INTEGER DEFAULT 0")
+
+    # --- NEW: Content hash of the code, for finding duplicate snippets ---
+    if 'code_hash' not in columns:
+        _report_upgrade("Adding 'code_hash' column...")
+        cursor.execute("ALTER TABLE snippets ADD COLUMN code_hash TEXT")
+    if 'code' in columns:
+        # Also picks up rows written by tools that don't set it
+        cursor.execute("UPDATE snippets SET code_hash = code_hash(code) WHERE code_hash IS NULL")
+
+    # --- NEW: Move the code out of the snippets rows, into compressed blobs ---
+    moved_code = _create_code_store(cursor, columns)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_snippets_code_hash ON snippets(code_hash)")
+
+    _create_list_indexes(cursor)
+
+    _create_fts_index(cursor)
+    _create_trigram_index(cursor)
+    _create_tag_index(cursor)
     
     conn.commit()
-    conn.close()
+    if moved_code:
+        # Return the pages the inline code used to take up to the file system
+        _report_upgrade("Compacting the database file...")
+        conn.execute("VACUUM")
     print("Database initialized and up-to-date.")
 
 
+# --- Compressed, deduplicated code storage ---
+# Each distinct code body is stored once in code_blobs, keyed by the
+# snippets.code_hash that points to it, and zlib-compressed when that makes
+# it smaller. List rows no longer carry the code, so the pages they read stay
+# small; get_snippet_by_id, the exporters and regex search decompress it.
+# Nothing in the schema depends on code_text(), which only the app registers,
+# so other SQLite clients can still read and write the library.
+CODE_SCHEMA = (
+    # `data` is a zlib BLOB, or TEXT for code that doesn't compress
+    """
+    CREATE TABLE IF NOT EXISTS code_blobs (
+        hash TEXT PRIMARY KEY,
+        data BLOB NOT NULL
+    )
+    """,
+)
+
+# Triggers that kept older search indexes in sync from snippets.code, or from
+# code_text() through the snippet_code view
+SEARCH_INDEX_TRIGGERS = (
+    "snippets_fts_insert", "snippets_fts_delete", "snippets_fts_update",
+    "snippets_trigram_insert", "snippets_trigram_delete", "snippets_trigram_update",
+)
+
+# SQLite 3.35 added ALTER TABLE ... DROP COLUMN
+DROP_COLUMN_VERSION = (3, 35, 0)
+
+# The full columns of a snippet, code included
+SNIPPET_QUERY = """
+    SELECT s.id, s.title, s.language, s.tags, s.is_favorite, s.created_at, s.code_hash,
+           code_text(b.data) AS code
+    FROM snippets s JOIN code_blobs b ON b.hash = s.code_hash"""
+
+
+def _pack_code(code):
+    raw = code.encode('utf-8', 'surrogatepass')
+    packed = zlib.compress(raw)
+    return packed if len(packed) < len(raw) else code
+
+
+def _unpack_code(data):
+    if isinstance(data, bytes):
+        return zlib.decompress(data).decode('utf-8', 'surrogatepass')
+    return data
+
+
+def _create_code_store(cursor, columns):
+    """
+    Creates code_blobs. A database that still has the code inline gets it
+    moved over (identical bodies once) and the inline column dropped;
+    returns True when that happened.
+    """
+    for statement in CODE_SCHEMA:
+        cursor.execute(statement)
+    old_view = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'snippet_code'").fetchone()
+    if 'code' not in columns and not old_view:
+        return False
+    if 'code' in columns:
+        _report_upgrade("Moving code into compressed storage...")
+        seen = set()
+
+        def blobs():
+            for row in cursor.connection.execute("SELECT code_hash, code FROM snippets"):
+                if row['code_hash'] not in seen:
+                    seen.add(row['code_hash'])
+                    yield row['code_hash'], _pack_code(row['code'])
+
+        cursor.executemany("INSERT OR IGNORE INTO code_blobs (hash, data) VALUES (?, ?)", blobs())
+    # The old search indexes read their text from snippets.code or the
+    # snippet_code view; _create_fts_index and _create_trigram_index rebuild them
+    for trigger in SEARCH_INDEX_TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute("DROP VIEW IF EXISTS snippet_code")
+    cursor.execute("DROP TABLE IF EXISTS snippets_fts")
+    cursor.execute("DROP TABLE IF EXISTS snippets_trigram")
+    if 'code' not in columns:
+        return False
+    _drop_inline_code(cursor)
+    return True
+
+
+def _drop_inline_code(cursor):
+    if sqlite3.sqlite_version_info >= DROP_COLUMN_VERSION:
+        cursor.execute("ALTER TABLE snippets DROP COLUMN code")
+        return
+    # Older SQLite can't drop a column: copy the table without it. Its
+    # indexes and the tag trigger go with the old table; initialize_db
+    # creates them again afterwards.
+    cursor.execute("""
+        CREATE TABLE snippets_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            language TEXT NOT NULL,
+            tags TEXT,
+            code_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_favorite INTEGER DEFAULT 0
+        )
+    """)
+    cursor.execute("""
+        INSERT INTO snippets_new (id, title, language, tags, code_hash, created_at, is_favorite)
+        SELECT id, title, language, tags, code_hash, created_at, is_favorite FROM snippets
+    """)
+    # Keep AUTOINCREMENT from handing out the ids of deleted snippets again
+    cursor.execute("""
+        UPDATE sqlite_sequence SET seq = (SELECT seq FROM sqlite_sequence WHERE name = 'snippets')
+        WHERE name = 'snippets_new'
+    """)
+    cursor.execute("DROP TABLE snippets")
+    cursor.execute("ALTER TABLE snippets_new RENAME TO snippets")
+
+
+def _store_code(conn, code):
+    """Stores `code` in code_blobs unless the same code is there already; returns its hash."""
+    digest = code_hash(code)
+    if conn.execute("SELECT 1 FROM code_blobs WHERE hash = ?", (digest,)).fetchone() is None:
+        conn.execute("INSERT INTO code_blobs (hash, data) VALUES (?, ?)", (digest, _pack_code(code)))
+    return digest
+
+
+def _snippet_texts(conn):
+    """Yields (id, title, tags, language, code) of every snippet, to fill the search indexes from."""
+    for row in conn.execute(
+        "SELECT s.id, s.title, s.tags, s.language, b.data FROM snippets s JOIN code_blobs b ON b.hash = s.code_hash"
+    ):
+        yield row['id'], row['title'], row['tags'], row['language'], _unpack_code(row['data'])
+
+
+def _index_snippets(conn, rows):
+    """Adds (id, title, tags, language, code) rows to the search indexes."""
+    if not _fts_available(conn):
+        return
+    rows = list(rows)
+    conn.executemany("INSERT INTO snippets_fts(rowid, title, tags, language, code) VALUES (?, ?, ?, ?, ?)", rows)
+    if _trigram_available(conn):
+        conn.executemany("INSERT INTO snippets_trigram(rowid, code) VALUES (?, ?)", ((row[0], row[4]) for row in rows))
+
+
+def _unindex_snippet(conn, snippet_id):
+    """Removes a snippet from the search indexes."""
+    if not _fts_available(conn):
+        return
+    # snippets_fts holds the text both indexes were given, and the
+    # contentless trigram index can only remove a row given that text
+    indexed = conn.execute("SELECT code FROM snippets_fts WHERE rowid = ?", (snippet_id,)).fetchone()
+    if indexed is None:
+        return  # written by another client, never indexed
+    if _trigram_available(conn):
+        conn.execute(
+            "INSERT INTO snippets_trigram(snippets_trigram, rowid, code) VALUES ('delete', ?, ?)",
+            (snippet_id, indexed['code'])
+        )
+    conn.execute("DELETE FROM snippets_fts WHERE rowid = ?", (snippet_id,))
+
+
+def _release_code(conn, digest):
+    """Deletes the code with hash `digest` once no snippet uses it any more."""
+    conn.execute(
+        "DELETE FROM code_blobs WHERE hash = ? AND NOT EXISTS (SELECT 1 FROM snippets WHERE code_hash = ?)",
+        (digest, digest)
+    )
+
+
+# --- Full-text search index ---
+# snippets_fts keeps its own copy of the text it indexes, since the code in
+# code_blobs is compressed. add_snippet, add_snippets, update_snippet and
+# delete_snippet keep it in sync in the same transaction as the snippet.
+FTS_SCHEMA = (
+    """
+    CREATE VIRTUAL TABLE snippets_fts USING fts5(
+        title, tags, language, code,
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+)
+
+# bm25 column weights: a hit in the title outranks tags, language and code
+FTS_RANK = "bm25(10.0, 5.0, 2.0, 1.0)"
+
+# Each result's excerpt costs a lookup of the full row, so ranked search only
+# returns the best matches instead of every row that mentions the query.
+SEARCH_RESULT_LIMIT = 200
+
+# bm25 has to score every match before the best can be picked, which for a
+# short prefix typed into a large library is most of it. Only the newest
+# matches, up to this many, are ranked; smaller result sets rank all of them.
+SEARCH_RANK_CANDIDATES = 500
+
+# Markers placed around matched terms in the `match` column of search results
+MATCH_START, MATCH_END, MATCH_ELLIPSIS = "«", "»", "…"
+
+_fts_enabled = None
+
+
+def _create_fts_index(cursor):
+    """Creates the FTS5 index, backfilling it on first creation."""
+    global _fts_enabled
+    exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'snippets_fts'"
+    ).fetchone()
+    if exists:
+        _fts_enabled = True
+        return
+    try:
+        for statement in FTS_SCHEMA:
+            cursor.execute(statement)
+    except sqlite3.OperationalError as e:
+        # SQLite built without FTS5: search_snippets falls back to LIKE
+        print(f"Full-text search unavailable ({e}); using simple search.")
+        _fts_enabled = False
+        return
+    cursor.execute("INSERT INTO snippets_fts(snippets_fts, rank) VALUES ('rank', ?)", (FTS_RANK,))
+    _report_upgrade("Building full-text search index...")
+    cursor.executemany(
+        "INSERT INTO snippets_fts(rowid, title, tags, language, code) VALUES (?, ?, ?, ?, ?)",
+        _snippet_texts(cursor.connection)
+    )
+    _fts_enabled = True
+
+
+def _fts_available(conn):
+    global _fts_enabled
+    if _fts_enabled is None:
+        _fts_enabled = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'snippets_fts'"
+        ).fetchone() is not None
+    return _fts_enabled
+
+
+def _fts_query(query):
+    """
+    Turns free text into an FTS5 query where every word must match. The last
+    word is still being typed, so it matches as a prefix once it has two
+    characters (a one-letter prefix would match, and rank, nearly every row).
+    """
+    words = re.findall(r"\w+", query)
+    terms = [f'"{word}"' for word in words]
+    if words and len(words[-1]) >= 2:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+# --- Trigram index for substring and regex search in code ---
+# FTS5's trigram tokenizer indexes every 3-character sequence of the code, so
+# any literal of 3+ characters can be looked up without scanning the table.
+# Regex search uses it to narrow down candidates, then runs the real regex.
+# It is contentless: the code it would store is already in snippets_fts.
+TRIGRAM_SCHEMA = (
+    """
+    CREATE VIRTUAL TABLE snippets_trigram USING fts5(
+        code, content='', tokenize='trigram'
+    )
+    """,
+)
+
+# Candidates are checked inline until this much code has been scanned; the
+# rest goes to worker processes, with a bounded number of chunks in flight.
+REGEX_PARALLEL_MIN_BYTES = 4 * 1024 * 1024
+REGEX_CHUNK_BYTES = 1024 * 1024
+REGEX_MAX_PENDING_CHUNKS = 2 * (os.cpu_count() or 1)
+
+_trigram_enabled = None
+_regex_pool = LazyProcessPool()
+
+
+def _create_trigram_index(cursor):
+    """Creates the trigram index, backfilling it on first creation."""
+    global _trigram_enabled
+    exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'snippets_trigram'"
+    ).fetchone()
+    if exists:
+        _trigram_enabled = True
+        return
+    try:
+        for statement in TRIGRAM_SCHEMA:
+            cursor.execute(statement)
+    except sqlite3.OperationalError as e:
+        # SQLite older than 3.34 has no trigram tokenizer: regex search scans every row
+        print(f"Trigram index unavailable ({e}); regex search will scan all snippets.")
+        _trigram_enabled = False
+        return
+    _report_upgrade("Building trigram index...")
+    cursor.execute("INSERT INTO snippets_trigram(rowid, code) SELECT rowid, code FROM snippets_fts")
+    _trigram_enabled = True
+
+
+def _trigram_available(conn):
+    global _trigram_enabled
+    if _trigram_enabled is None:
+        _trigram_enabled = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'snippets_trigram'"
+        ).fetchone() is not None
+    return _trigram_enabled
+
+
+def _required_literals(pattern):
+    """
+    Returns literal strings (3+ characters) that every match of `pattern` must
+    contain. Only runs of plain characters in the top-level sequence qualify;
+    anything else (groups, classes, repeats, alternation) just ends a run, so
+    the result is always safe to use as a pre-filter.
+    """
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except re.error:
+        return []
+    ignore_case = bool(parsed.state.flags & re.IGNORECASE)
+
+    literals, run = [], []
+    for op, av in list(parsed) + [(None, None)]:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        if op is sre_parse.AT:
+            continue  # anchors don't consume characters
+        literal = "".join(run)
+        run = []
+        # The trigram index folds case the Unicode way, re the ASCII way only
+        # for some characters; keep case-insensitive pre-filters to ASCII.
+        if len(literal) >= 3 and (not ignore_case or literal.isascii()):
+            literals.append(literal)
+    return literals
+
+
+def _scan_chunk(pattern, flags, rows):
+    """Runs the regex over (id, code) pairs; returns (id, line_numbers) per hit."""
+    regex = re.compile(pattern, flags)
+    hits = []
+    for snippet_id, code in rows:
+        lines = []
+        for match in regex.finditer(code):
+            line = code.count("\n", 0, match.start()) + 1
+            if not lines or lines[-1] != line:
+                lines.append(line)
+        if lines:
+            hits.append((snippet_id, lines))
+    return hits
+
+
+def regex_search_snippets(pattern, favorites_only=False, tags=None, match_all=True):
+    """
+    Finds snippets whose code matches the regular expression `pattern`,
+    optionally only among favorites or snippets with `tags` (see get_snippets_page).
+
+    Returns dicts with the list columns plus `lines`, the 1-based line numbers
+    that contain a match, in list order. Raises re.error for an invalid
+    pattern.
+    """
+    regex = re.compile(pattern, re.MULTILINE)
+    conn = get_db_connection()
+
+    literals = _required_literals(regex)
+    if literals and _trigram_available(conn):
+        # Every literal must appear in the code; each is quoted as an FTS5 string
+        trigram_query = " AND ".join('"' + literal.replace('"', '""') + '"' for literal in literals)
+        candidate_query = """
+            SELECT s.id, s.title, s.language, s.tags, s.is_favorite, code_text(b.data) AS code
+            FROM snippets_trigram JOIN snippets s ON s.id = snippets_trigram.rowid
+            JOIN code_blobs b ON b.hash = s.code_hash
+            WHERE snippets_trigram MATCH ?"""
+        params = [trigram_query]
+    else:
+        candidate_query = """
+            SELECT s.id, s.title, s.language, s.tags, s.is_favorite, code_text(b.data) AS code
+            FROM snippets s JOIN code_blobs b ON b.hash = s.code_hash WHERE 1"""
+        params = []
+    if favorites_only:
+        candidate_query += " AND s.is_favorite = 1"
+    if tags:
+        condition, tag_params = _tag_filter(tags, match_all, "s.id")
+        candidate_query += f" AND {condition}"
+        params += tag_params
+    candidate_query += " ORDER BY s.title COLLATE NOCASE, s.id"
+
+    results = []
+    pending = deque()  # (future, metadata) of chunks handed to the pool
+    scanned_bytes = 0
+
+    def collect(hits, metadata):
+        for snippet_id, lines in hits:
+            results.append({**metadata[snippet_id], 'match': None, 'lines': lines})
+
+    # Candidates stream through in chunks; only the metadata of the current
+    # chunks and of the hits is kept, never every candidate's code.
+    try:
+        for chunk, metadata, chunk_bytes in _iter_code_chunks(conn.execute(candidate_query, params)):
+            _check_cancelled()
+            if scanned_bytes < REGEX_PARALLEL_MIN_BYTES:
+                collect(_scan_chunk(regex.pattern, regex.flags, chunk), metadata)
+            else:
+                pending.append((_regex_pool.get().submit(_scan_chunk, regex.pattern, regex.flags, chunk), metadata))
+                while len(pending) > REGEX_MAX_PENDING_CHUNKS:
+                    future, chunk_metadata = pending.popleft()
+                    collect(future.result(), chunk_metadata)
+            scanned_bytes += chunk_bytes
+        while pending:
+            _check_cancelled()
+            future, chunk_metadata = pending.popleft()
+            collect(future.result(), chunk_metadata)
+    finally:
+        for future, _ in pending:
+            future.cancel()
+    return results
+
+
+def _iter_code_chunks(rows):
+    """Groups candidate rows into chunks of roughly REGEX_CHUNK_BYTES of code."""
+    chunk, metadata, chunk_bytes = [], {}, 0
+    for row in rows:
+        snippet_id, code = row['id'], row['code']
+        chunk.append((snippet_id, code))
+        metadata[snippet_id] = {
+            'id': snippet_id, 'title': row['title'], 'language': row['language'],
+            'tags': row['tags'], 'is_favorite': row['is_favorite'],
+        }
+        chunk_bytes += len(code)
+        if chunk_bytes >= REGEX_CHUNK_BYTES:
+            yield chunk, metadata, chunk_bytes
+            chunk, metadata, chunk_bytes = [], {}, 0
+    if chunk:
+        yield chunk, metadata, chunk_bytes
+
+
 # --- NEW: Function to toggle the favorite status of a snippet ---
 def toggle_favorite_status(snippet_id):
     conn = get_db_connection()
-    # First, get the current status
-    current_status = conn.execute(
-        "SELECT is_favorite FROM snippets WHERE id = ?", (snippet_id,)
-    ).fetchone()['is_favorite']
-    
-    # Flip the status (0 becomes 1, 1 becomes 0)
-    new_status = 1 - current_status
-    
-    conn.execute(
-        "UPDATE snippets SET is_favorite = ? WHERE id = ?",
-        (new_status, snippet_id)
-    )
-    conn.commit()
-    conn.close()
+    with conn:
+        # First, get the current status
+        current_status = conn.execute(
+            "SELECT is_favorite FROM snippets WHERE id = ?", (snippet_id,)
+        ).fetchone()['is_favorite']
+
+        # Flip the status (0 becomes 1, 1 becomes 0)
+        new_status = 1 - current_status
+
+        conn.execute(
+            "UPDATE snippets SET is_favorite = ? WHERE id = ?",
+            (new_status, snippet_id)
+        )
     return new_status
 
 def get_all_snippets():
-    conn = get_db_connection()
-    snippets = conn.execute("SELECT id, title, language, tags, is_favorite FROM snippets ORDER BY title ASC").fetchall()
-    conn.close()
-    return snippets
+    return list(iter_snippets())
 
 # --- NEW: Function to get only favorite snippets ---
 def get_favorite_snippets():
+    return list(iter_snippets(favorites_only=True))
+
+# --- Normalized tags ---
+# The comma-separated `tags` column stays the text the user edits; tags and
+# snippet_tags index it, so filtering by tag is an exact, indexed lookup.
+# Triggers keep each tag's snippet_count up to date as links come and go,
+# so the tag facet list is a plain read instead of an aggregate scan.
+TAG_SCHEMA = (
+    """
+    CREATE TABLE tags (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE COLLATE NOCASE,
+        snippet_count INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE snippet_tags (
+        snippet_id INTEGER NOT NULL,
+        tag_id INTEGER NOT NULL,
+        PRIMARY KEY (snippet_id, tag_id)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX idx_snippet_tags_tag ON snippet_tags(tag_id, snippet_id)",
+    """
+    CREATE TRIGGER snippet_tags_insert AFTER INSERT ON snippet_tags BEGIN
+        UPDATE tags SET snippet_count = snippet_count + 1 WHERE id = new.tag_id;
+    END
+    """,
+    """
+    CREATE TRIGGER snippet_tags_delete AFTER DELETE ON snippet_tags BEGIN
+        UPDATE tags SET snippet_count = snippet_count - 1 WHERE id = old.tag_id;
+    END
+    """,
+)
+
+# Created on its own: it goes with the snippets table when an upgrade has to copy it
+SNIPPETS_TAGS_TRIGGER = """
+    CREATE TRIGGER IF NOT EXISTS snippets_tags_delete AFTER DELETE ON snippets BEGIN
+        DELETE FROM snippet_tags WHERE snippet_id = old.id;
+    END
+"""
+
+
+def parse_tags(tags):
+    """Splits a comma-separated tags string into distinct tag names (case-insensitively)."""
+    names, seen = [], set()
+    for name in (tags or "").split(","):
+        name = name.strip()
+        if name and name.casefold() not in seen:
+            seen.add(name.casefold())
+            names.append(name)
+    return names
+
+
+def _create_tag_index(cursor):
+    """Creates the tag tables, filling them from the tags column on first creation."""
+    exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'snippet_tags'").fetchone()
+    if not exists:
+        _report_upgrade("Building tag index...")
+        for statement in TAG_SCHEMA:
+            cursor.execute(statement)
+        rows = cursor.execute("SELECT id, tags FROM snippets WHERE tags != ''").fetchall()
+        _link_tags(cursor, ((row['id'], row['tags']) for row in rows))
+    cursor.execute(SNIPPETS_TAGS_TRIGGER)
+
+
+def _link_tags(conn, snippets):
+    """Links each (snippet id, tags string) to its tags, creating new tags as needed."""
+    links = [(snippet_id, name) for snippet_id, tags in snippets for name in parse_tags(tags)]
+    conn.executemany("INSERT OR IGNORE INTO tags (name) VALUES (?)", ((name,) for _, name in links))
+    conn.executemany(
+        "INSERT OR IGNORE INTO snippet_tags (snippet_id, tag_id) SELECT ?, id FROM tags WHERE name = ?", links
+    )
+
+
+def _set_snippet_tags(conn, snippet_id, tags):
+    conn.execute("DELETE FROM snippet_tags WHERE snippet_id = ?", (snippet_id,))
+    _link_tags(conn, [(snippet_id, tags)])
+
+
+def _tag_filter(tags, match_all=True, column="id"):
+    """
+    SQL condition (and its parameters) selecting snippets with all of `tags`
+    (or, with match_all=False, any of them). Tag names match exactly, ignoring case.
+    """
+    placeholders = ",".join("?" * len(tags))
+    condition = f"""{column} IN (
+        SELECT st.snippet_id FROM snippet_tags st JOIN tags t ON t.id = st.tag_id
+        WHERE t.name IN ({placeholders})"""
+    params = list(tags)
+    if match_all:
+        condition += " GROUP BY st.snippet_id HAVING COUNT(*) = ?"
+        params.append(len(set(tag.casefold() for tag in tags)))
+    return condition + ")", params
+
+
+def get_tag_counts():
+    """Returns (name, snippet_count) rows of every tag in use, most used first."""
+    conn = get_db_connection()
+    return conn.execute(
+        "SELECT name, snippet_count FROM tags WHERE snippet_count > 0 ORDER BY snippet_count DESC, name COLLATE NOCASE"
+    ).fetchall()
+
+
+# --- Keyset pagination for the snippet list ---
+# Lists are ordered by (title COLLATE NOCASE, id) and each page starts right
+# after the last row of the previous one, so fetching page N costs the same as
+# page 1. Both orderings are served straight from covering indexes.
+SNIPPET_PAGE_SIZE = 200
+
+LIST_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_snippets_list ON snippets(title COLLATE NOCASE, id, is_favorite, language, tags)",
+    "CREATE INDEX IF NOT EXISTS idx_snippets_favorites ON snippets(is_favorite, title COLLATE NOCASE, id, language, tags)",
+)
+
+# SQLite's NOCASE only folds ASCII letters
+_NOCASE = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+
+def _create_list_indexes(cursor):
+    cursor.execute("DROP INDEX IF EXISTS idx_snippets_title")  # superseded by idx_snippets_list
+    for statement in LIST_INDEXES:
+        cursor.execute(statement)
+
+
+def list_sort_key(snippet):
+    """Python equivalent of the (title COLLATE NOCASE, id) list order."""
+    return (snippet['title'].translate(_NOCASE), snippet['id'])
+
+
+def get_snippets_page(after_title=None, after_id=None, limit=SNIPPET_PAGE_SIZE, favorites_only=False,
+                      tags=None, match_all=True):
+    """
+    Returns up to `limit` list rows that sort after (after_title, after_id),
+    optionally only favorites, or snippets with all (or any) of `tags`.
+    """
+    conn = get_db_connection()
+    query = "SELECT id, title, language, tags, is_favorite FROM snippets WHERE 1"
+    params = []
+    if favorites_only:
+        query += " AND is_favorite = 1"
+    if tags:
+        condition, tag_params = _tag_filter(tags, match_all)
+        query += f" AND {condition}"
+        params += tag_params
+    if after_id is not None:
+        # The first condition is redundant but lets SQLite seek in the index
+        query += " AND title COLLATE NOCASE >= ? AND (title COLLATE NOCASE, id) > (?, ?)"
+        params += [after_title, after_title, after_id]
+    query += " ORDER BY title COLLATE NOCASE, id LIMIT ?"
+    params.append(limit)
+    return conn.execute(query, params).fetchall()
+
+def iter_snippets(after_title=None, after_id=None, limit=None, favorites_only=False,
+                  page_size=SNIPPET_PAGE_SIZE, tags=None, match_all=True):
+    """
+    Yields list rows in title order, starting after (after_title, after_id),
+    one keyset page at a time. Stops after `limit` rows if given. Only one
+    page is held in memory, so callers can walk the whole library.
+    """
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        page = get_snippets_page(after_title, after_id, size, favorites_only, tags, match_all)
+        yield from page
+        if len(page) < size:
+            return
+        after_title, after_id = page[-1]['title'], page[-1]['id']
+        if remaining is not None:
+            remaining -= len(page)
+
+def iter_snippets_with_code(language=None, tag=None, favorites_only=False, page_size=SNIPPET_PAGE_SIZE):
+    """
+    Yields full snippet rows (code included) in id order, optionally only
+    those of one language, with one tag, or favorites. Pages are fetched by
+    id keyset, so only `page_size` snippets' code is in memory at a time.
+    """
+    conditions, params = [], []
+    if language:
+        conditions.append("s.language = ?")
+        params.append(language)
+    if tag:
+        condition, tag_params = _tag_filter([tag], column="s.id")
+        conditions.append(condition)
+        params += tag_params
+    if favorites_only:
+        conditions.append("s.is_favorite = 1")
+    where = "".join(f" AND {condition}" for condition in conditions)
+
+    conn = get_db_connection()
+    after_id = 0
+    while True:
+        page = conn.execute(
+            f"{SNIPPET_QUERY} WHERE s.id > ?{where} ORDER BY s.id LIMIT ?",
+            [after_id, *params, page_size],
+        ).fetchall()
+        yield from page
+        if len(page) < page_size:
+            return
+        after_id = page[-1]['id']
+
+def get_snippet_summary(snippet_id):
+    """Returns the list columns of one snippet (no code), or None."""
     conn = get_db_connection()
-    snippets = conn.execute("SELECT id, title, language, tags, is_favorite FROM snippets WHERE is_favorite = 1 ORDER BY title ASC").fetchall()
-    conn.close()
-    return snippets
+    return conn.execute(
+        "SELECT id, title, language, tags, is_favorite FROM snippets WHERE id = ?", (snippet_id,)
+    ).fetchone()
 
 def get_snippet_by_id(snippet_id):
     conn = get_db_connection()
-    snippet = conn.execute("SELECT * FROM snippets WHERE id = ?", (snippet_id,)).fetchone()
-    conn.close()
-    return snippet
+    return conn.execute(f"{SNIPPET_QUERY} WHERE s.id = ?", (snippet_id,)).fetchone()
 
 # --- Other functions (add, update, delete, search) remain largely the same ---
 
 def add_snippet(title, language, tags, code):
+    """Adds a snippet and returns its id."""
     conn = get_db_connection()
-    conn.execute(
-        "INSERT INTO snippets (title, language, tags, code) VALUES (?, ?, ?, ?)",
-        (title, language, tags, code)
-    )
-    conn.commit()
-    conn.close()
+    with conn:
+        cursor = conn.execute(
+            "INSERT INTO snippets (title, language, tags, code_hash) VALUES (?, ?, ?, ?)",
+            (title, language, tags, _store_code(conn, code))
+        )
+        _set_snippet_tags(conn, cursor.lastrowid, tags)
+        _index_snippets(conn, [(cursor.lastrowid, title, tags, language, code)])
+    return cursor.lastrowid
+
+def add_snippets(snippets):
+    """
+    Adds many snippets, given as (title, language, tags, code, is_favorite)
+    tuples, in a single transaction. Returns how many were added.
+    """
+    conn = get_db_connection()
+    rows, codes, blobs = [], [], {}
+    for title, language, tags, code, is_favorite in snippets:
+        digest = code_hash(code)
+        if digest not in blobs:
+            blobs[digest] = code
+        rows.append((title, language, tags, is_favorite, digest))
+        codes.append(code)
+    with conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO code_blobs (hash, data) VALUES (?, ?)",
+            ((digest, _pack_code(code)) for digest, code in blobs.items())
+        )
+        conn.executemany(
+            "INSERT INTO snippets (title, language, tags, is_favorite, code_hash) VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+        # AUTOINCREMENT ids are handed out in order, and the transaction
+        # keeps other writers out, so the new rows hold the last len(rows) ids
+        last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        first_id = last_id - len(rows) + 1
+        _link_tags(conn, ((first_id + i, row[2]) for i, row in enumerate(rows)))
+        _index_snippets(conn, ((first_id + i, row[0], row[2], row[1], code)
+                               for i, (row, code) in enumerate(zip(rows, codes))))
+    return len(rows)
+
+def existing_code_hashes(hashes):
+    """Returns the subset of `hashes` that some snippet's code already has."""
+    conn = get_db_connection()
+    hashes = list(hashes)
+    found = set()
+    # Stay well under SQLite's limit on bound parameters
+    for i in range(0, len(hashes), 500):
+        batch = hashes[i:i + 500]
+        found.update(row[0] for row in conn.execute(
+            f"SELECT hash FROM code_blobs WHERE hash IN ({','.join('?' * len(batch))})", batch
+        ))
+    return found
     
 def update_snippet(snippet_id, title, language, tags, code):
     conn = get_db_connection()
-    conn.execute(
-        "UPDATE snippets SET title = ?, language = ?, tags = ?, code = ? WHERE id = ?",
-        (title, language, tags, code, snippet_id)
-    )
-    conn.commit()
-    conn.close()
+    with conn:
+        old = conn.execute("SELECT code_hash FROM snippets WHERE id = ?", (snippet_id,)).fetchone()
+        digest = _store_code(conn, code)
+        conn.execute(
+            "UPDATE snippets SET title = ?, language = ?, tags = ?, code_hash = ? WHERE id = ?",
+            (title, language, tags, digest, snippet_id)
+        )
+        _set_snippet_tags(conn, snippet_id, tags)
+        _unindex_snippet(conn, snippet_id)
+        _index_snippets(conn, [(snippet_id, title, tags, language, code)])
+        if old is not None and old['code_hash'] != digest:
+            _release_code(conn, old['code_hash'])
 
 def delete_snippet(snippet_id):
     conn = get_db_connection()
-    conn.execute("DELETE FROM snippets WHERE id = ?", (snippet_id,))
-    conn.commit()
-    conn.close()
+    with conn:
+        old = conn.execute("SELECT code_hash FROM snippets WHERE id = ?", (snippet_id,)).fetchone()
+        conn.execute("DELETE FROM snippets WHERE id = ?", (snippet_id,))
+        _unindex_snippet(conn, snippet_id)
+        if old is not None:
+            _release_code(conn, old['code_hash'])
 
-def search_snippets(query, favorites_only=False):
+def search_snippets(query, favorites_only=False, limit=SEARCH_RESULT_LIMIT, tags=None, match_all=True):
+    """
+    Searches title, tags, language and code, returning at most `limit` rows,
+    best matches first (among the newest SEARCH_RANK_CANDIDATES matches).
+    `tags` and `match_all` filter as in get_snippets_page.
+
+    Each row carries a `match` column with a short excerpt of the best matching
+    column, matched terms wrapped in MATCH_START/MATCH_END (None when the
+    simple LIKE search had to be used).
+    """
     conn = get_db_connection()
+    if not query.strip():
+        return list(iter_snippets(limit=limit, favorites_only=favorites_only, tags=tags, match_all=match_all))
+
+    fts_query = _fts_query(query)
+    if not fts_query or not _fts_available(conn):
+        return _like_search(conn, query, favorites_only, limit, tags, match_all)
+
+    match_query = """
+        FROM snippets_fts JOIN snippets s ON s.id = snippets_fts.rowid
+        WHERE snippets_fts MATCH ?"""
+    params = [fts_query]
+    if favorites_only:
+        match_query += " AND s.is_favorite = 1"
+    if tags:
+        condition, tag_params = _tag_filter(tags, match_all, "s.id")
+        match_query += f" AND {condition}"
+        params += tag_params
+
+    # Rowid of the oldest candidate to rank (None: fewer matches than that)
+    oldest = conn.execute(
+        f"SELECT snippets_fts.rowid {match_query} ORDER BY snippets_fts.rowid DESC LIMIT 1 OFFSET ?",
+        params + [max(SEARCH_RANK_CANDIDATES, limit) - 1]
+    ).fetchone()
+    if oldest is not None:
+        match_query += " AND snippets_fts.rowid >= ?"
+        params.append(oldest[0])
+
+    base_query = f"""
+        SELECT s.id, s.title, s.language, s.tags, s.is_favorite,
+               snippet(snippets_fts, -1, '{MATCH_START}', '{MATCH_END}', '{MATCH_ELLIPSIS}', 8) AS match
+        {match_query} ORDER BY rank LIMIT ?"""
+    params.append(limit)
+
+    return conn.execute(base_query, params).fetchall()
+
+def _like_search(conn, query, favorites_only, limit, tags=None, match_all=True):
     search_term = f"%{query}%"
     
-    base_query = "SELECT id, title, language, tags, is_favorite FROM snippets WHERE (title LIKE ? OR tags LIKE ? OR language LIKE ?)"
+    base_query = "SELECT id, title, language, tags, is_favorite, NULL AS match FROM snippets WHERE (title LIKE ? OR tags LIKE ? OR language LIKE ?)"
     params = [search_term, search_term, search_term]
 
     if favorites_only:
         base_query += " AND is_favorite = 1"
+    if tags:
+        condition, tag_params = _tag_filter(tags, match_all)
+        base_query += f" AND {condition}"
+        params += tag_params
         
-    base_query += " ORDER BY title ASC"
+    base_query += " ORDER BY title COLLATE NOCASE, id LIMIT ?"
+    params.append(limit)
 
-    snippets = conn.execute(base_query, params).fetchall()
-    conn.close()
-    return snippets
\ No newline at end of file
+    return conn.execute(base_query, params).fetchall()
@@ -0,0 +1,156 @@
+# codesnap/export.py
+"""
+Headless bulk export: renders snippets from the database to image files.
+
+    python export.py --out docs/img [--language python] [--tag cli] [--favorites]
+                     [--style monokai] [--font-size 16] [--no-line-numbers]
+                     [--format PNG] [--workers 4] [--force]
+
+Files are named snippet-<id>.<ext>. A manifest in the output directory
+records what each file was rendered from, so re-running the same command
+(after an interruption, or in CI) only renders snippets that are new or
+changed since; --force renders everything again.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from pygments.util import ClassNotFound
+
+import database_manager as db
+from core.encoders import EXPORT_FORMATS, available_formats, save_image
+from core.fonts import get_fonts
+from core.image_generator import generate_image
+from core.render_cache import render_key
+from core.themes import get_theme
+
+FONT_PATH = os.path.join("assets", "fonts", "FiraCode-Regular.ttf")
+MANIFEST_NAME = ".codesnap-export.jsonl"
+# Report throughput every this many seconds
+REPORT_INTERVAL = 2.0
+
+
+def export_snippet(code, language, style, font_path, font_size, line_numbers, path, format_name):
+    """Runs in a worker process: renders one snippet and writes its file."""
+    image = generate_image(code, language, style, font_path, font_size, line_numbers)
+    if image is None:
+        raise RuntimeError("rendering failed")
+    save_image(image, path, format_name)
+    return os.path.getsize(path)
+
+
+def load_manifest(out_dir):
+    """Returns {file name: render key} of files completed by earlier runs."""
+    done = {}
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME), encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by an interrupted run
+                done[entry['file']] = entry['key']
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Render snippets to image files without the GUI.")
+    parser.add_argument("--out", required=True, help="output directory")
+    parser.add_argument("--db", default=db.DB_FILE, help="snippet database (default: %(default)s)")
+    parser.add_argument("--language", help="only snippets in this language")
+    parser.add_argument("--tag", help="only snippets with this tag")
+    parser.add_argument("--favorites", action="store_true", help="only favorite snippets")
+    parser.add_argument("--style", default="monokai")
+    parser.add_argument("--font", default=FONT_PATH)
+    parser.add_argument("--font-size", type=int, default=16)
+    parser.add_argument("--no-line-numbers", action="store_true")
+    parser.add_argument("--format", default="PNG", choices=available_formats())
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--force", action="store_true", help="re-render files that are up to date")
+    args = parser.parse_args(argv)
+    # Checked here rather than failing in every worker, once per snippet
+    try:
+        get_theme(args.style)
+    except ClassNotFound:
+        parser.error(f"unknown style {args.style!r}")
+    if not os.path.exists(args.font):
+        # Not a file: it may still name an installed font
+        try:
+            get_fonts(args.font, args.font_size)
+        except Exception:
+            parser.error(f"font not found: {args.font}")
+    if args.font_size <= 0:
+        parser.error(f"invalid font size {args.font_size}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    db.DB_FILE = args.db
+    db.initialize_db()
+    line_numbers = not args.no_line_numbers
+    extension = EXPORT_FORMATS[args.format][1]
+    os.makedirs(args.out, exist_ok=True)
+    done = {} if args.force else load_manifest(args.out)
+
+    # Each pending render holds one snippet's code; the images themselves
+    # only ever exist inside the workers, which write their own files
+    max_in_flight = args.workers * 2
+    pending = deque()
+    rendered = skipped = failed = 0
+    start = last_report = time.perf_counter()
+
+    def collect(manifest):
+        nonlocal rendered, failed
+        future, name, key, title = pending.popleft()
+        try:
+            future.result()
+        except Exception as e:
+            failed += 1
+            print(f"  failed: {title!r}: {e}", file=sys.stderr)
+            return
+        rendered += 1
+        manifest.write(json.dumps({'file': name, 'key': key}) + "\n")
+        manifest.flush()
+
+    with open(os.path.join(args.out, MANIFEST_NAME), "a", encoding="utf-8") as manifest, \
+            ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        for snippet in db.iter_snippets_with_code(args.language, args.tag, args.favorites):
+            name = f"snippet-{snippet['id']}{extension}"
+            path = os.path.join(args.out, name)
+            key = render_key(snippet['code'], snippet['language'], args.style, args.font,
+                             args.font_size, line_numbers) + args.format
+            if done.get(name) == key and os.path.exists(path):
+                skipped += 1
+                continue
+            future = pool.submit(export_snippet, snippet['code'], snippet['language'], args.style,
+                                 args.font, args.font_size, line_numbers, path, args.format)
+            pending.append((future, name, key, snippet['title']))
+            while len(pending) > max_in_flight:
+                collect(manifest)
+
+            now = time.perf_counter()
+            if now - last_report >= REPORT_INTERVAL:
+                last_report = now
+                print(f"  {rendered} rendered, {rendered / (now - start):.1f} images/s")
+        while pending:
+            collect(manifest)
+
+    elapsed = time.perf_counter() - start
+    rate = rendered / elapsed if elapsed else 0.0
+    print(f"{rendered} rendered, {skipped} up to date, {failed} failed "
+          f"in {elapsed:.1f} s ({rate:.1f} images/s)")
+    db.close_db()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,16 +4,42 @@ import sys
 from PyQt6.QtWidgets import QApplication
 from ui.main_window import MainWindow
 import database_manager as db
+from core.formatters import shutdown_formatter
+
+# Passed by startup_report.py: report start-up milestones on stderr, then exit
+EXIT_AFTER_STARTUP_FLAG = "--exit-after-startup"
+
+
+def shutdown_render_pool():
+    # The renderer is only imported once an image has been exported
+    image_generator = sys.modules.get('core.image_generator')
+    if image_generator is not None:
+        image_generator.shutdown_render_pool()
+
+
+def report_milestone(name):
+    print(f"codesnap-startup: {name}", file=sys.stderr, flush=True)
+
 
 def main():
-    # Initialize the database
-    db.initialize_db()
-    
-    # Create and run the application
+    exit_after_startup = EXIT_AFTER_STARTUP_FLAG in sys.argv
+    if exit_after_startup:
+        sys.argv.remove(EXIT_AFTER_STARTUP_FLAG)
+
+    # Create and run the application; the database is initialized by the
+    # window once it has been shown (see MainWindow.finish_startup)
     app = QApplication(sys.argv)
+    # Close the long-lived database connections once the event loop is done
+    app.aboutToQuit.connect(db.close_db)
+    app.aboutToQuit.connect(shutdown_render_pool)
+    app.aboutToQuit.connect(shutdown_formatter)
     window = MainWindow()
+    if exit_after_startup:
+        window.firstPainted.connect(lambda: report_milestone("first-paint"))
+        window.startupFinished.connect(lambda: report_milestone("ready"))
+        window.startupFinished.connect(app.quit)
     window.show()
     sys.exit(app.exec())
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,321 @@
+# codesnap/server.py
+"""
+Local render server: renders snippets over HTTP so a build can request
+thousands of images without starting a Python process for each one.
+
+    python server.py [--port 8765 | --socket /tmp/codesnap.sock] [--workers 4]
+
+    POST /render  JSON {"code", "language", "style", "font_size",
+                        "line_numbers", "format"} -> the encoded image
+    GET  /stats   JSON request counts, queue depth and latency percentiles
+
+Worker processes are started once and warmed up (modules imported, font,
+style and lexers loaded) before the first request. Requests that arrive
+together are batched into a single round trip to a worker. When the queue
+is full the server answers 503 with Retry-After rather than queueing
+without limit.
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import queue
+import signal
+import socketserver
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FONT_PATH = os.path.join("assets", "fonts", "FiraCode-Regular.ttf")
+# Requests waiting for a worker; beyond this the server answers 503
+QUEUE_SIZE = 256
+# At most this many requests go to a worker in one batch...
+BATCH_SIZE = 16
+# ...and a batch waits at most this long for more requests to join it
+BATCH_WAIT = 0.005
+# Latency percentiles are computed over the most recent requests
+LATENCY_SAMPLES = 10000
+# Largest request body accepted
+MAX_BODY_BYTES = 4 * 1024 * 1024
+WARM_LANGUAGES = ("python", "javascript", "text")
+
+_font_path = FONT_PATH
+
+
+def _warm_worker(font_path, style, font_size, languages):
+    """Worker initializer: loads everything the first real request would need."""
+    global _font_path
+    _font_path = font_path
+    from core.image_generator import generate_image
+    for language in languages:
+        generate_image("def warm(up):\n    return 0\n", language, style, font_path, font_size, True)
+
+
+def _render_batch(jobs):
+    """Runs in a worker: renders and encodes each job, returning (ok, bytes or message) per job."""
+    from core.encoders import encode_image
+    from core.image_generator import generate_image
+    results = []
+    for job in jobs:
+        try:
+            image = generate_image(job['code'], job['language'], job['style'], _font_path,
+                                   job['font_size'], job['line_numbers'])
+            if image is None:
+                raise RuntimeError("rendering failed")
+            results.append((True, encode_image(image, job['format'])))
+        except Exception as e:
+            results.append((False, str(e)))
+    return results
+
+
+class RenderRequest:
+    """A job waiting in the queue, and where its result is handed back."""
+    __slots__ = ('job', 'received', 'done', 'ok', 'result')
+
+    def __init__(self, job):
+        self.job = job
+        self.received = time.perf_counter()
+        self.done = threading.Event()
+        self.ok = False
+        self.result = None
+
+
+class RenderService:
+    """
+    Owns the warm worker pool and a bounded request queue. A dispatcher
+    thread drains the queue into batches and hands each to a free worker;
+    no more batches are in flight than there are workers, so when rendering
+    falls behind the queue fills up and new requests are turned away.
+    """
+    def __init__(self, font_path, workers, style="monokai", font_size=16, queue_size=QUEUE_SIZE):
+        self.workers = workers
+        self.queue = queue.Queue(queue_size)
+        self.pool = ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_worker, initargs=(font_path, style, font_size, WARM_LANGUAGES),
+        )
+        self._free_workers = threading.Semaphore(workers)
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.rendered = self.failed = self.rejected = self.batches = 0
+        self.started = time.time()
+        # Start every worker now, so the warm-up isn't paid by the first requests
+        for future in [self.pool.submit(_render_batch, []) for _ in range(workers)]:
+            future.result()
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, job):
+        """Queues a job; returns the RenderRequest, or None when the queue is full."""
+        request = RenderRequest(job)
+        try:
+            self.queue.put_nowait(request)
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            return None
+        return request
+
+    def _dispatch(self):
+        while True:
+            batch = [self.queue.get()]
+            if batch[0] is None:
+                return
+            deadline = time.perf_counter() + BATCH_WAIT
+            while len(batch) < BATCH_SIZE:
+                try:
+                    request = self.queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if request is None:
+                    self.queue.put(None)  # finish this batch, then stop
+                    break
+                batch.append(request)
+            self._free_workers.acquire()
+            future = self.pool.submit(_render_batch, [request.job for request in batch])
+            future.add_done_callback(lambda f, batch=batch: self._finish(batch, f))
+
+    def _finish(self, batch, future):
+        self._free_workers.release()
+        try:
+            results = future.result()
+        except Exception as e:
+            results = [(False, str(e))] * len(batch)
+        now = time.perf_counter()
+        with self._stats_lock:
+            self.batches += 1
+            for request, (ok, result) in zip(batch, results):
+                self._latencies.append(now - request.received)
+                if ok:
+                    self.rendered += 1
+                else:
+                    self.failed += 1
+        for request, (ok, result) in zip(batch, results):
+            request.ok, request.result = ok, result
+            request.done.set()
+
+    def stats(self):
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                'rendered': self.rendered, 'failed': self.failed, 'rejected': self.rejected,
+                'batches': self.batches, 'queued': self.queue.qsize(), 'workers': self.workers,
+                'uptime_s': round(time.time() - self.started, 1),
+            }
+        for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+            if latencies:
+                index = min(len(latencies) - 1, math.ceil(fraction * len(latencies)) - 1)
+                stats[f'{name}_ms'] = round(latencies[index] * 1000, 2)
+            else:
+                stats[f'{name}_ms'] = None
+        return stats
+
+    def close(self):
+        self.queue.put(None)
+        self._dispatcher.join()
+        self.pool.shutdown()
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    server_version = "CodeSnap"
+    protocol_version = "HTTP/1.1"  # keep-alive, so a build can reuse one connection
+
+    def do_GET(self):
+        if self.path != "/stats":
+            self._reply(404, b"not found\n")
+            return
+        self._reply(200, json.dumps(self.server.service.stats()).encode() + b"\n", "application/json")
+
+    def do_POST(self):
+        if self.path != "/render":
+            self._reply(404, b"not found\n")
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY_BYTES:
+            self._reply(413, b"request too large\n")
+            return
+        try:
+            job = self._parse_job(json.loads(self.rfile.read(length)))
+        except (ValueError, KeyError, TypeError) as e:
+            self._reply(400, f"bad request: {e}\n".encode())
+            return
+
+        request = self.server.service.submit(job)
+        if request is None:
+            self._reply(503, b"render queue full\n", extra_headers={'Retry-After': '1'})
+            return
+        request.done.wait()
+        if request.ok:
+            from core.encoders import EXPORT_FORMATS
+            pil_format = EXPORT_FORMATS[job['format']][0].lower()
+            self._reply(200, request.result, f"image/{pil_format}")
+        else:
+            self._reply(500, f"render failed: {request.result}\n".encode())
+
+    def _parse_job(self, body):
+        """Builds a render job from the request body, raising ValueError for anything unusable."""
+        from core.encoders import available_formats
+        from core.lexers import get_lexer
+        from core.themes import get_theme
+        job = {
+            'code': str(body['code']),
+            'language': str(body.get('language', 'text')),
+            'style': str(body.get('style', 'monokai')),
+            'font_size': int(body.get('font_size', 16)),
+            'line_numbers': bool(body.get('line_numbers', True)),
+            'format': str(body.get('format', 'PNG')),
+        }
+        if job['format'] not in available_formats():
+            raise ValueError(f"unsupported format {job['format']!r}")
+        if job['font_size'] <= 0:
+            raise ValueError(f"invalid font_size {job['font_size']}")
+        # Pygments' ClassNotFound is a ValueError; caught here, an unknown
+        # language or style is a 400 rather than a failed render
+        get_lexer(job['language'])
+        get_theme(job['style'])
+        return job
+
+    def _reply(self, status, body, content_type="text/plain", extra_headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket peers have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class RenderServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 resets bursts of build connections
+    request_queue_size = 128
+
+
+class UnixRenderServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve snippet renders over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--font", default=FONT_PATH)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.exists(args.font):
+        print(f"Font not found: {args.font}", file=sys.stderr)
+        return 1
+
+    print(f"Starting {args.workers} render worker(s)...")
+    service = RenderService(args.font, args.workers, queue_size=args.queue_size)
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = UnixRenderServer(args.socket, RenderHandler)
+        where = args.socket
+    else:
+        server = RenderServer((args.host, args.port), RenderHandler)
+        where = f"http://{args.host}:{args.port}"
+    server.service = service
+    server.verbose = args.verbose
+    print(f"Rendering on {where}")
+    # Shut down on SIGTERM as on Ctrl+C, so the workers don't outlive the server
+    signal.signal(signal.SIGTERM, _stop)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
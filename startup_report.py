@@ -0,0 +1,95 @@
+# codesnap/startup_report.py
+"""
+Measures how long the application takes to start.
+
+    python startup_report.py [--runs 5] [--budget 800] [--top 15]
+
+Launches `main.py` several times (on the offscreen Qt platform unless
+QT_QPA_PLATFORM is set), timing from process start to the window's first
+paint and to the snippet list being ready, then once more under
+`-X importtime` to list the slowest imports made before the first paint.
+With --budget, exits with status 1 when the median time to first paint is
+over that many milliseconds, so CI can catch start-up regressions.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+MILESTONE_PREFIX = "codesnap-startup: "
+# A start-up that hasn't finished by then is reported as a failure
+STARTUP_TIMEOUT = 60
+
+
+def launch(import_time=False):
+    """
+    Starts the application once and waits for it to exit by itself.
+    Returns ({milestone: ms since launch}, [(self ms, cumulative ms, module)]
+    imported before the first paint).
+    """
+    command = [sys.executable]
+    if import_time:
+        command += ["-X", "importtime"]
+    command += [MAIN_SCRIPT, "--exit-after-startup"]
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    milestones, imports = {}, []
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=os.path.dirname(MAIN_SCRIPT), env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    try:
+        for line in process.stderr:
+            if line.startswith(MILESTONE_PREFIX):
+                milestones[line[len(MILESTONE_PREFIX):].strip()] = (time.perf_counter() - start) * 1000
+            elif line.startswith("import time:") and "first-paint" not in milestones:
+                fields = line[len("import time:"):].split("|")
+                if fields[0].strip().isdigit():  # skip the header line
+                    imports.append((int(fields[0]) / 1000, int(fields[1]) / 1000, fields[2].rstrip()))
+        process.wait(STARTUP_TIMEOUT)
+    finally:
+        if process.poll() is None:
+            process.kill()
+    if "ready" not in milestones:
+        raise RuntimeError(f"the application exited with status {process.returncode} before starting up")
+    return milestones, imports
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time application start-up.")
+    parser.add_argument("--runs", type=int, default=5, help="timed launches (default: %(default)s)")
+    parser.add_argument("--budget", type=float, help="fail if the median first paint takes longer (ms)")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list (default: %(default)s)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # The first launch warms the disk cache and is not counted
+    launch()
+    runs = [launch()[0] for _ in range(args.runs)]
+    first_paint = statistics.median(run["first-paint"] for run in runs)
+    ready = statistics.median(run["ready"] for run in runs)
+    print(f"Time to first paint: {first_paint:7.1f} ms (median of {args.runs})")
+    print(f"Snippet list ready:  {ready:7.1f} ms")
+
+    _, imports = launch(import_time=True)
+    print("\nSlowest imports before the first paint (-X importtime, ms):")
+    print(f"{'self':>8} {'cumulative':>11}  module")
+    for self_ms, cumulative_ms, module in sorted(imports, key=lambda i: i[1], reverse=True)[:args.top]:
+        print(f"{self_ms:8.1f} {cumulative_ms:11.1f}  {module}")
+
+    if args.budget is not None:
+        if first_paint > args.budget:
+            print(f"\nFAIL: first paint took {first_paint:.1f} ms, over the {args.budget:g} ms budget")
+            return 1
+        print(f"\nOK: first paint within the {args.budget:g} ms budget")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
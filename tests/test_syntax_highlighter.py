@@ -0,0 +1,66 @@
+# codesnap/tests/test_syntax_highlighter.py
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pygments.token import Comment, Keyword
+
+from core.lexers import get_lexer
+from core.syntax_highlighter import LineLexer
+
+
+def lex_document(language, code):
+    """Lexes `code` line by line as the highlighter does; returns each line's token type per character."""
+    line_lexer = LineLexer(language)
+    lines = code.split("\n")
+    state = 0
+    styled = []
+    for number, text in enumerate(lines):
+        pending = line_lexer._states[state][1]
+        runs, state = line_lexer.lex(text, state, lines[number - pending:number])
+        types = [None] * len(text)
+        for start, length, ttype in runs:
+            types[start:start + length] = [ttype] * length
+        styled.append(types)
+    return styled
+
+
+def lex_whole(language, code):
+    """The same, from one pass of the Pygments lexer over the whole document."""
+    types = []
+    for _, ttype, value in get_lexer(language).get_tokens_unprocessed(code + "\n"):
+        types += [ttype] * len(value)
+    styled, pos = [], 0
+    for text in code.split("\n"):
+        styled.append(types[pos:pos + len(text)])
+        pos += len(text) + 1
+    return styled
+
+
+def test_multiline_js_comment():
+    code = "var a = 1; /* starts here\n   still a comment\n   ends here */ var b = 2;\nfunction f() {}"
+    styled = lex_document('javascript', code)
+    assert styled == lex_whole('javascript', code)
+    assert styled[0][11:] == [Comment.Multiline] * len("/* starts here")
+    assert set(styled[1]) == {Comment.Multiline}
+    assert styled[2][:len("   ends here */")] == [Comment.Multiline] * len("   ends here */")
+    assert styled[2][-len("var b = 2;"):][:3] == [Keyword.Declaration] * 3
+
+
+def test_unterminated_js_comment_styles_as_comment():
+    code = "/* never closed\nvar a = 1;"
+    styled = lex_document('javascript', code)
+    assert set(styled[0]) == {Comment.Multiline}
+    assert set(styled[1]) == {Comment.Multiline}
+
+
+def test_block_comments_match_whole_document():
+    documents = {
+        'css': "a { color: red; } /* one\ntwo */\nb { margin: 0 }",
+        'html': "<p>hi</p>\n<!-- a comment\n  spanning -->\n<script>\n/* in\n script */ var x;\n</script>",
+        'python': 'def f():\n    """Docstring\n    over lines.\n    """\n    return 1',
+    }
+    for language, code in documents.items():
+        assert lex_document(language, code) == lex_whole(language, code), language
@@ -0,0 +1,282 @@
+# codesnap/ui/code_editor.py
+
+import time
+from PyQt6.QtWidgets import QPlainTextEdit
+from PyQt6.QtCore import QTimer, pyqtSignal
+from PyQt6.QtGui import QTextCursor, QTextLayout
+
+# Documents at least this big open in large-document mode
+LARGE_DOCUMENT_CHARS = 256 * 1024
+# Lines inserted per event-loop slice while a large document loads
+LOAD_CHUNK_LINES = 2000
+# Blocks above and below the viewport highlighted along with it
+VISIBLE_MARGIN_BLOCKS = 50
+# Time budget of one idle-time highlighting slice
+IDLE_SLICE_SECONDS = 0.008
+
+
+class CodeEditor(QPlainTextEdit):
+    """
+    Plain-text code editor with a large-document mode.
+
+    Small documents are highlighted by the attached SyntaxHighlighter as usual.
+    Documents of LARGE_DOCUMENT_CHARS or more are loaded in chunks from the
+    event loop, and the highlighter is detached: the editor highlights the
+    visible blocks (plus a margin) right away and lexes the rest of the
+    document, top to bottom, in short idle-time slices using the same
+    line lexer and formats.
+    """
+    # Emitted for edits, but not for the chunks appended while loading
+    userTextChanged = pyqtSignal()
+    textPasted = pyqtSignal()
+    loadingFinished = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.highlighter = None
+        self.large_mode = False
+
+        self._pending_lines = None
+        self._pending_index = 0
+        self._appending = False
+        self._load_timer = QTimer(self)
+        self._load_timer.setInterval(0)
+        self._load_timer.timeout.connect(self._load_next_chunk)
+
+        # Blocks before _frontier have their exact lexer end state in
+        # userState() and are highlighted. After an edit, blocks from
+        # _dirty_until to _valid_until may still be valid: the idle pass
+        # skips ahead once a block's end state comes out unchanged.
+        self._frontier = 0
+        self._dirty_until = 0
+        self._valid_until = 0
+        self._block_count = 1
+        self._idle_timer = QTimer(self)
+        self._idle_timer.setInterval(0)
+        self._idle_timer.timeout.connect(self._highlight_idle_slice)
+
+        self.textChanged.connect(self._on_text_changed)
+        self.document().contentsChange.connect(self._on_contents_change)
+        self.verticalScrollBar().valueChanged.connect(self._on_viewport_moved)
+
+    def set_highlighter(self, highlighter):
+        self.highlighter = highlighter
+
+    def set_language(self, language):
+        # Before the window has finished starting up there is no highlighter yet
+        if self.highlighter is None:
+            return
+        if self.highlighter.set_language(language) and self.large_mode:
+            self._restart_highlighting()
+
+    def set_style(self, style):
+        if self.highlighter is None:
+            return
+        self.highlighter.set_style(style, rehighlight=not self.large_mode)
+        if self.large_mode:
+            self._restart_highlighting()
+
+    # --- Loading ---
+
+    def load_text(self, text):
+        """Replaces the document, switching to large-document mode if needed."""
+        self._stop_loading()
+        large = len(text) >= LARGE_DOCUMENT_CHARS
+        if not large:
+            self.large_mode = False
+            self._idle_timer.stop()
+            self.setPlainText(text)
+            if self.highlighter and self.highlighter.document() is None:
+                self.highlighter.setDocument(self.document())
+            return
+
+        self.large_mode = True
+        if self.highlighter and self.highlighter.document() is not None:
+            self.highlighter.setDocument(None)
+        lines = text.split("\n")
+        self.setUndoRedoEnabled(False)  # loading isn't an undoable edit
+        self.setPlainText("\n".join(lines[:LOAD_CHUNK_LINES]))
+        self._pending_lines = lines
+        self._pending_index = LOAD_CHUNK_LINES
+        self._restart_highlighting()
+        if self._pending_index < len(lines):
+            self._load_timer.start()
+        else:
+            self._finish_load()
+
+    def clear(self):
+        self.load_text("")
+
+    def is_loading(self):
+        return self._pending_lines is not None
+
+    def finish_loading(self):
+        """Appends whatever is still waiting to be loaded, synchronously."""
+        while self._pending_lines is not None:
+            self._load_next_chunk(len(self._pending_lines))
+
+    def go_to_line(self, line):
+        """Puts the cursor at the start of 1-based `line` and scrolls to it."""
+        if line > self.document().blockCount():
+            self.finish_loading()
+        block = self.document().findBlockByNumber(line - 1)
+        if block.isValid():
+            self.setTextCursor(QTextCursor(block))
+            self.ensureCursorVisible()
+
+    def toPlainText(self):
+        # Callers always get the full text, even while it is still loading
+        self.finish_loading()
+        return super().toPlainText()
+
+    def _load_next_chunk(self, chunk_lines=LOAD_CHUNK_LINES):
+        lines, start = self._pending_lines, self._pending_index
+        end = start + chunk_lines
+        cursor = QTextCursor(self.document())
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        self._appending = True
+        try:
+            cursor.insertText("\n" + "\n".join(lines[start:end]))
+        finally:
+            self._appending = False
+        self._pending_index = end
+        self._idle_timer.start()  # highlight the new blocks in idle time
+        if end >= len(lines):
+            self._finish_load()
+
+    def _finish_load(self):
+        self._load_timer.stop()
+        self._pending_lines = None
+        self.setUndoRedoEnabled(True)
+        self.loadingFinished.emit()
+
+    def _stop_loading(self):
+        self._load_timer.stop()
+        if self._pending_lines is not None:
+            self._pending_lines = None
+            self.setUndoRedoEnabled(True)
+
+    def insertFromMimeData(self, source):
+        super().insertFromMimeData(source)
+        if source.hasText():
+            self.textPasted.emit()
+
+    def _on_text_changed(self):
+        if not self._appending:
+            self.userTextChanged.emit()
+
+    # --- Lazy highlighting (large-document mode) ---
+
+    def _restart_highlighting(self):
+        self._frontier = self._dirty_until = self._valid_until = 0
+        self._block_count = self.document().blockCount()
+        self._highlight_visible()
+        self._idle_timer.start()
+
+    def _on_contents_change(self, position, removed, added):
+        if not self.large_mode:
+            return
+        document = self.document()
+        first = document.findBlock(position).blockNumber()
+        last = document.findBlock(position + added).blockNumber()
+        delta = document.blockCount() - self._block_count
+        self._block_count = document.blockCount()
+        if self._appending:
+            return  # new blocks at the end; the idle pass gets to them
+
+        if first < self._frontier:
+            # Blocks past the edit keep their states; they just moved by delta
+            self._valid_until = max(self._valid_until, self._frontier) + delta
+            self._frontier = first
+        elif first < self._valid_until:
+            self._valid_until += delta
+        self._dirty_until = max(self._dirty_until + delta, last + 1)
+        self._highlight_visible()
+        self._idle_timer.start()
+
+    def _on_viewport_moved(self):
+        if self.large_mode:
+            self._highlight_visible()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._on_viewport_moved()
+
+    def _highlight_visible(self):
+        """Highlights the blocks on screen (plus a margin) that aren't done yet."""
+        first = self.firstVisibleBlock()
+        if not first.isValid():
+            return
+        document = self.document()
+        line_height = max(1, self.fontMetrics().height())
+        visible = self.viewport().height() // line_height + 1
+        start = max(self._frontier, first.blockNumber() - VISIBLE_MARGIN_BLOCKS)
+        end = first.blockNumber() + visible + VISIBLE_MARGIN_BLOCKS
+        block = document.findBlockByNumber(start)
+        previous = block.previous()
+        # Without the exact state of the previous block, resuming from its
+        # guessed state is the best we can do until the idle pass arrives
+        state = max(previous.userState(), 0) if previous.isValid() else 0
+        first_changed = block
+        line_lexer = self.highlighter.line_lexer
+        while block.isValid() and block.blockNumber() <= end:
+            runs, state = line_lexer.lex(block.text(), state, line_lexer.previous_lines(block, state))
+            self._apply_formats(block, runs)
+            last_changed = block
+            block = block.next()
+        if first_changed.isValid() and first_changed.blockNumber() <= end:
+            self._mark_dirty(first_changed, last_changed)
+
+    def _highlight_idle_slice(self):
+        """Exactly lexes blocks from the frontier on, for one time slice."""
+        if not self.large_mode or self.highlighter is None:
+            self._idle_timer.stop()
+            return
+        deadline = time.perf_counter() + IDLE_SLICE_SECONDS
+        lexer = self.highlighter.line_lexer
+        block = self.document().findBlockByNumber(self._frontier)
+        previous = block.previous()
+        state = previous.userState() if previous.isValid() else 0
+        first_changed = last_changed = block
+        while block.isValid():
+            number = block.blockNumber()
+            runs, end_state = lexer.lex(block.text(), state, lexer.previous_lines(block, state))
+            converged = (
+                self._dirty_until <= number < self._valid_until
+                and block.userState() == end_state
+            )
+            block.setUserState(end_state)
+            self._apply_formats(block, runs)
+            last_changed = block
+            state = end_state
+            block = block.next()
+            self._frontier = number + 1
+            if converged:
+                # Everything up to _valid_until is already right
+                self._mark_dirty(first_changed, last_changed)
+                self._frontier = self._valid_until
+                self._dirty_until = self._valid_until = 0
+                block = first_changed = last_changed = self.document().findBlockByNumber(self._frontier)
+                state = block.previous().userState() if block.isValid() else state
+            if time.perf_counter() >= deadline:
+                break
+        else:
+            self._idle_timer.stop()
+        if first_changed.isValid() and last_changed.isValid():
+            self._mark_dirty(first_changed, last_changed)
+
+    def _apply_formats(self, block, runs):
+        format_for = self.highlighter.format_table.format_for
+        ranges = []
+        for start, length, ttype in runs:
+            format_range = QTextLayout.FormatRange()
+            format_range.start = start
+            format_range.length = length
+            format_range.format = format_for(ttype)
+            ranges.append(format_range)
+        block.layout().setFormats(ranges)
+
+    def _mark_dirty(self, first_block, last_block):
+        """Makes the document re-layout (and repaint) a run of re-formatted blocks."""
+        start = first_block.position()
+        self.document().markContentsDirty(start, last_block.position() + last_block.length() - start)
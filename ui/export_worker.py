@@ -0,0 +1,145 @@
+# codesnap/ui/export_worker.py
+
+import threading
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+from PyQt6.QtGui import QImage
+from core.encoders import save_image
+from core.image_generator import ExportCancelled, export_png_tiled, generate_image, tokenize
+from core.render_cache import get_render_cache
+
+# Lines of code shown in the export preview
+PREVIEW_LINES = 60
+
+
+class ExportSignals(QObject):
+    """Signals emitted by an ExportTask, delivered on the GUI thread."""
+    # lines drawn, line count (0 while encoding: progress unknown)
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(str)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+
+class ExportTask(QRunnable):
+    """
+    Renders and encodes one image export on a worker thread.
+
+    Long snippets are streamed to PNG tile by tile (export_png_tiled);
+    everything else is rendered through the render cache and then encoded
+    with the chosen format and settings. cancel() stops the render at the
+    next progress report; an encode already under way runs to the end, but
+    its output is discarded.
+    """
+    def __init__(self, code, language, style, font_path, font_size, line_numbers,
+                 path, format_name, settings, streaming=False, tokens=None):
+        super().__init__()
+        self.code = code
+        self.language = language
+        self.style = style
+        self.font_path = font_path
+        self.font_size = font_size
+        self.line_numbers = line_numbers
+        self.path = path
+        self.format_name = format_name
+        self.settings = settings
+        self.streaming = streaming
+        self.tokens = tokens  # from the preview, when it lexed all of the code
+        self.cancel_event = threading.Event()
+        self.signals = ExportSignals()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def report_progress(self, done, total):
+        if self.cancel_event.is_set():
+            raise ExportCancelled()
+        self.signals.progress.emit(done, total)
+
+    def run(self):
+        try:
+            if self.streaming:
+                export_png_tiled(
+                    self.code, self.language, self.style, self.font_path, self.font_size,
+                    self.line_numbers, self.path,
+                    compress_level=self.settings.get('compress_level', 6),
+                    progress=self.report_progress, tokens=self.tokens,
+                )
+            else:
+                image = get_render_cache().render(
+                    self.code, self.language, self.style, self.font_path, self.font_size,
+                    self.line_numbers, progress=self.report_progress, tokens=self.tokens,
+                )
+                if image is None:
+                    self.signals.failed.emit("Failed to generate the image.")
+                    return
+                self.report_progress(0, 0)
+                save_image(image, self.path, self.format_name, self.cancel_event, **self.settings)
+        except ExportCancelled:
+            self.signals.cancelled.emit()
+            return
+        except Exception as e:
+            self.signals.failed.emit(f"Failed to export the image:\n{e}")
+            return
+        self.signals.finished.emit(self.path)
+
+
+class PreviewSignals(QObject):
+    """Signals emitted by a PreviewTask, delivered on the GUI thread."""
+    # generation, preview QImage, tokens of the lines lexed for it
+    finished = pyqtSignal(int, object, object)
+    failed = pyqtSignal(int, str)
+
+
+class PreviewTask(QRunnable):
+    """
+    Renders the first PREVIEW_LINES lines of an export preview on a worker
+    thread.
+
+    Only those lines are lexed (plus one, to tell whether that is all of the
+    code), and the tokens are handed back for later previews to reuse. A
+    newer settings change cancels the task at its next progress check.
+    """
+    def __init__(self, generation, code, language, style, font_path, font_size, line_numbers, tokens=None):
+        super().__init__()
+        self.generation = generation
+        self.code = code
+        self.language = language
+        self.style = style
+        self.font_path = font_path
+        self.font_size = font_size
+        self.line_numbers = line_numbers
+        self.tokens = tokens
+        self.cancel_event = threading.Event()
+        self.signals = PreviewSignals()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def check_cancelled(self, done=0, total=0):
+        if self.cancel_event.is_set():
+            raise ExportCancelled()
+
+    def run(self):
+        try:
+            self.check_cancelled()  # superseded before it got a thread
+            tokens = self.tokens
+            if tokens is None:
+                tokens = tokenize(self.code, self.language, PREVIEW_LINES + 1)
+            self.check_cancelled()
+            image = generate_image(
+                self.code, self.language, self.style, self.font_path, self.font_size,
+                self.line_numbers, progress=self.check_cancelled, tokens=tokens[:PREVIEW_LINES],
+            )
+            if image is None:
+                self.signals.failed.emit(self.generation, "Preview failed.")
+                return
+            # QImage (unlike QPixmap) may be built off the GUI thread
+            data = image.tobytes()
+            preview = QImage(data, image.width, image.height, image.width * 4,
+                             QImage.Format.Format_RGBA8888).copy()
+        except ExportCancelled:
+            return
+        except Exception as e:
+            self.signals.failed.emit(self.generation, f"Preview failed: {e}")
+            return
+        self.signals.finished.emit(self.generation, preview, tokens)
@@ -0,0 +1,39 @@
+# codesnap/ui/format_worker.py
+
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+from core.formatters import FormatError, format_code
+
+
+class FormatSignals(QObject):
+    """Signals emitted by a FormatTask, delivered on the GUI thread."""
+    # generation, source code, formatted code
+    finished = pyqtSignal(int, str, str)
+    # generation, message
+    failed = pyqtSignal(int, str)
+
+
+class FormatTask(QRunnable):
+    """
+    Prettifies code on a worker thread.
+
+    Carries a generation number, like LanguageGuessTask, so the window can
+    drop a result that arrives after another snippet has been loaded.
+    """
+    def __init__(self, generation, code, language):
+        super().__init__()
+        self.generation = generation
+        self.code = code
+        self.language = language
+        self.signals = FormatSignals()
+
+    def run(self):
+        try:
+            formatted = format_code(self.code, self.language)
+        except FormatError as e:
+            self.signals.failed.emit(self.generation, str(e))
+            return
+        except Exception as e:
+            print(f"Formatting error: {e}")
+            self.signals.failed.emit(self.generation, f"An error occurred during formatting: {e}")
+            return
+        self.signals.finished.emit(self.generation, self.code, formatted)
@@ -1,67 +1,268 @@
 # codesnap/ui/image_dialog.py
 
 from PyQt6.QtWidgets import (
-    QDialog, QVBoxLayout, QFormLayout, QComboBox,
-    QSpinBox, QCheckBox, QPushButton, QFileDialog, QMessageBox
+    QDialog, QVBoxLayout, QHBoxLayout, QFormLayout, QComboBox, QLabel,
+    QSpinBox, QCheckBox, QPushButton, QFileDialog, QMessageBox, QProgressBar
 )
-from pygments.styles import get_all_styles
-from core.image_generator import generate_image
+from PyQt6.QtCore import Qt, QThreadPool, QTimer
+from PyQt6.QtGui import QPixmap
+from core.themes import theme_names
+from core.encoders import EXPORT_FORMATS, DEFAULT_PNG_COMPRESS_LEVEL, DEFAULT_QUALITY, available_formats
+from .export_worker import PREVIEW_LINES, ExportTask, PreviewTask
 import os
 
 FONT_PATH = os.path.join("assets", "fonts", "FiraCode-Regular.ttf")
+# Snippets longer than this are streamed to the PNG in tiles instead of
+# being rendered as one image in memory
+STREAMING_EXPORT_LINES = 2000
+# Wait this long after the last settings change before re-rendering the preview
+PREVIEW_DEBOUNCE_MS = 150
 
 class ImageDialog(QDialog):
     def __init__(self, code, language, parent=None):
         super().__init__(parent)
         self.code = code
         self.language = language
+        self.export_task = None
         self.setWindowTitle("Export Code as Image")
-        
+
+        # --- Preview state ---
+        # One preview thread: a settings change cancels the render in flight,
+        # and results from older generations are dropped
+        self.preview_pool = QThreadPool(self)
+        self.preview_pool.setMaxThreadCount(1)
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(PREVIEW_DEBOUNCE_MS)
+        self.preview_timer.timeout.connect(self.render_preview)
+        self.preview_generation = 0
+        self.preview_task = None
+        self.preview_image = None
+        self.tokens = None  # the preview's lines, lexed once by the first preview
+
         layout = QVBoxLayout(self)
         form_layout = QFormLayout()
 
         self.style_combo = QComboBox()
-        self.style_combo.addItems(sorted(list(get_all_styles())))
+        self.style_combo.addItems(theme_names())
         self.style_combo.setCurrentText("monokai")
 
         self.font_size_spin = QSpinBox()
         self.font_size_spin.setRange(12, 36)
         self.font_size_spin.setValue(16)
-        
+
         self.line_numbers_check = QCheckBox()
         self.line_numbers_check.setChecked(True)
 
+        # --- Encoder settings ---
+        self.format_combo = QComboBox()
+        self.format_combo.addItems(available_formats())
+        self.format_combo.currentTextChanged.connect(self.update_encoder_options)
+
+        self.compress_level_spin = QSpinBox()
+        self.compress_level_spin.setRange(0, 9)
+        self.compress_level_spin.setValue(DEFAULT_PNG_COMPRESS_LEVEL)
+        self.compress_level_spin.setToolTip("0 is fastest, 9 makes the smallest files")
+
+        self.optimize_check = QCheckBox()
+        self.optimize_check.setToolTip("Spend longer looking for a smaller PNG")
+
+        self.lossless_check = QCheckBox()
+        self.lossless_check.setChecked(True)
+        self.lossless_check.toggled.connect(self.update_encoder_options)
+
+        self.quality_spin = QSpinBox()
+        self.quality_spin.setRange(1, 100)
+        self.quality_spin.setValue(DEFAULT_QUALITY)
+
         form_layout.addRow("Theme:", self.style_combo)
         form_layout.addRow("Font Size:", self.font_size_spin)
         form_layout.addRow("Show Line Numbers:", self.line_numbers_check)
-        
-        self.export_button = QPushButton("Export to PNG")
+        form_layout.addRow("Format:", self.format_combo)
+        form_layout.addRow("PNG Compression:", self.compress_level_spin)
+        form_layout.addRow("Optimize PNG:", self.optimize_check)
+        form_layout.addRow("Lossless:", self.lossless_check)
+        form_layout.addRow("Quality:", self.quality_spin)
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setVisible(False)
+
+        self.export_button = QPushButton("Export")
         self.export_button.clicked.connect(self.export)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.cancel)
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        button_layout.addWidget(self.cancel_button)
+        button_layout.addWidget(self.export_button)
 
+        self.preview_label = QLabel("Rendering preview...")
+        self.preview_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.preview_label.setMinimumSize(480, 270)
+
+        self.style_combo.currentTextChanged.connect(self.schedule_preview)
+        self.font_size_spin.valueChanged.connect(self.schedule_preview)
+        self.line_numbers_check.toggled.connect(self.schedule_preview)
+
+        layout.addWidget(self.preview_label)
         layout.addLayout(form_layout)
-        layout.addWidget(self.export_button)
+        layout.addWidget(self.progress_bar)
+        layout.addLayout(button_layout)
+        self.update_encoder_options()
+        self.schedule_preview()
+
+    # --- Preview ---
+
+    def schedule_preview(self):
+        """(Re)starts the debounce timer; the preview renders once settings settle."""
+        self.cancel_preview()
+        self.preview_timer.start()
+
+    def cancel_preview(self):
+        if self.preview_task is not None:
+            self.preview_task.cancel()
+            self.preview_task = None
+
+    def render_preview(self):
+        if not os.path.exists(FONT_PATH):
+            self.preview_label.setText("Font not found: no preview")
+            return
+        self.cancel_preview()
+        self.preview_generation += 1
+        self.preview_task = PreviewTask(
+            self.preview_generation, self.code, self.language, self.style_combo.currentText(),
+            FONT_PATH, self.font_size_spin.value(), self.line_numbers_check.isChecked(), self.tokens,
+        )
+        self.preview_task.signals.finished.connect(self.show_preview)
+        self.preview_task.signals.failed.connect(self.preview_failed)
+        self.preview_pool.start(self.preview_task)
+
+    def show_preview(self, generation, image, tokens):
+        if generation != self.preview_generation:
+            return
+        self.preview_task = None
+        self.tokens = tokens
+        self.preview_image = image
+        self.update_preview_pixmap()
+
+    def preview_failed(self, generation, message):
+        if generation == self.preview_generation:
+            self.preview_task = None
+            self.preview_label.setText(message)
+
+    def update_preview_pixmap(self):
+        if self.preview_image is None:
+            return
+        # Scaled down to fit; the preview never needs to be shown larger
+        pixmap = QPixmap.fromImage(self.preview_image)
+        if pixmap.width() > self.preview_label.width() or pixmap.height() > self.preview_label.height():
+            pixmap = pixmap.scaled(self.preview_label.size(), Qt.AspectRatioMode.KeepAspectRatio,
+                                   Qt.TransformationMode.SmoothTransformation)
+        self.preview_label.setPixmap(pixmap)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.update_preview_pixmap()
+
+    # --- Export ---
+
+    def update_encoder_options(self):
+        format_name = self.format_combo.currentText()
+        is_png = format_name == 'PNG'
+        can_be_lossy = EXPORT_FORMATS[format_name][3]
+        self.compress_level_spin.setEnabled(is_png)
+        self.optimize_check.setEnabled(is_png)
+        self.lossless_check.setEnabled(can_be_lossy)
+        self.quality_spin.setEnabled(can_be_lossy and not self.lossless_check.isChecked())
+
+    def encoder_settings(self):
+        if self.format_combo.currentText() == 'PNG':
+            return {
+                'compress_level': self.compress_level_spin.value(),
+                'optimize': self.optimize_check.isChecked(),
+            }
+        return {'lossless': self.lossless_check.isChecked(), 'quality': self.quality_spin.value()}
 
     def export(self):
         style = self.style_combo.currentText()
         font_size = self.font_size_spin.value()
         line_numbers = self.line_numbers_check.isChecked()
+        format_name = self.format_combo.currentText()
+        extension = EXPORT_FORMATS[format_name][1]
 
         # Check if the font file exists
         if not os.path.exists(FONT_PATH):
             QMessageBox.critical(self, "Font Not Found", f"The font file was not found at:\n{os.path.abspath(FONT_PATH)}\nPlease add a .ttf font to that location.")
             return
 
-        image = generate_image(self.code, self.language, style, FONT_PATH, font_size, line_numbers)
-        
-        if image:
-            # Open "Save As" dialog
-            file_path, _ = QFileDialog.getSaveFileName(
-                self, "Save Image", "code_snippet.png", "PNG Images (*.png)"
-            )
-            
-            if file_path:
-                image.save(file_path)
-                QMessageBox.information(self, "Success", f"Image saved to {file_path}")
-                self.accept() # Close the dialog
+        # Open "Save As" dialog
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "Save Image", f"code_snippet{extension}", f"{format_name} Images (*{extension})"
+        )
+        if not file_path:
+            return
+
+        # Long snippets are streamed to PNG in tiles, in bounded memory
+        streaming = format_name == 'PNG' and self.code.count("\n") >= STREAMING_EXPORT_LINES
+        # The preview's tokens are reused when they hold all of the code;
+        # anything longer is lexed by the export, streamed when streaming
+        tokens = None
+        if not streaming and self.tokens is not None and len(self.tokens) <= PREVIEW_LINES:
+            tokens = self.tokens
+        self.export_task = ExportTask(
+            self.code, self.language, style, FONT_PATH, font_size, line_numbers,
+            file_path, format_name, self.encoder_settings(), streaming=streaming, tokens=tokens,
+        )
+        self.export_task.signals.progress.connect(self.export_progress)
+        self.export_task.signals.finished.connect(self.export_finished)
+        self.export_task.signals.failed.connect(self.export_failed)
+        self.export_task.signals.cancelled.connect(self.export_cancelled)
+        self.set_exporting(True)
+        QThreadPool.globalInstance().start(self.export_task)
+
+    def set_exporting(self, exporting):
+        self.export_button.setEnabled(not exporting)
+        self.progress_bar.setVisible(exporting)
+        self.progress_bar.setRange(0, 0)  # busy until the first report
+
+    def export_progress(self, done, total):
+        if total:
+            self.progress_bar.setFormat("Rendering... %p%")
+            self.progress_bar.setRange(0, total)
+            self.progress_bar.setValue(done)
         else:
-            QMessageBox.critical(self, "Error", "Failed to generate the image.")
\ No newline at end of file
+            self.progress_bar.setFormat("Encoding...")
+            self.progress_bar.setRange(0, 0)
+
+    def export_finished(self, file_path):
+        self.export_task = None
+        self.set_exporting(False)
+        QMessageBox.information(self, "Success", f"Image saved to {file_path}")
+        self.accept() # Close the dialog
+
+    def export_failed(self, message):
+        self.export_task = None
+        self.set_exporting(False)
+        QMessageBox.critical(self, "Error", message)
+
+    def export_cancelled(self):
+        self.export_task = None
+        self.set_exporting(False)
+
+    def cancel(self):
+        """Stops a running export, or closes the dialog when there is none."""
+        if self.export_task is None:
+            self.reject()
+            return
+        self.export_task.cancel()
+        self.progress_bar.setFormat("Cancelling...")
+
+    def done(self, result):
+        # Closing the dialog abandons the preview and any export; the workers
+        # drop their results when they next check in
+        self.preview_timer.stop()
+        self.cancel_preview()
+        if self.export_task is not None:
+            self.export_task.cancel()
+            self.export_task = None
+        super().done(result)
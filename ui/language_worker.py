@@ -0,0 +1,34 @@
+# codesnap/ui/language_worker.py
+
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+
+
+class LanguageSignals(QObject):
+    """Signals emitted by a LanguageGuessTask, delivered on the GUI thread."""
+    # generation, guessed language ('' when no supported language matched)
+    finished = pyqtSignal(int, str)
+
+
+class LanguageGuessTask(QRunnable):
+    """
+    Guesses the language of a piece of code on a worker thread.
+
+    Like SearchTask, it carries a generation number so the window can ignore
+    a guess that arrives after the code has been replaced or guessed again.
+    """
+    def __init__(self, generation, code, languages):
+        super().__init__()
+        self.generation = generation
+        self.code = code
+        self.languages = languages
+        self.signals = LanguageSignals()
+
+    def run(self):
+        # Imported here so Pygments isn't loaded before the window is shown
+        from core.lexers import guess_language
+        try:
+            language = guess_language(self.code, self.languages)
+        except Exception as e:
+            print(f"Error guessing language: {e}")
+            language = None
+        self.signals.finished.emit(self.generation, language or '')
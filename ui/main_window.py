@@ -1,29 +1,79 @@
 # codesnap/ui/main_window.py
 
-import subprocess
-import jsbeautifier
+import time
+from contextlib import contextmanager
 from PyQt6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QListWidget, QTextEdit, QLineEdit, QPushButton,
-    QSplitter, QFormLayout, QLabel, QComboBox, QListWidgetItem, QMessageBox,
+    QListView, QListWidget, QListWidgetItem, QLineEdit, QPushButton,
+    QSplitter, QFormLayout, QLabel, QComboBox, QMessageBox,
     QStatusBar, QApplication, QStyle
 )
-from PyQt6.QtCore import Qt, QSize, QSettings # <-- TIER 3: Import QSettings
+from PyQt6.QtCore import Qt, QSize, QSettings, QTimer, QThreadPool, QEvent, pyqtSignal # <-- TIER 3: Import QSettings
 from PyQt6.QtGui import QFont, QKeySequence, QShortcut, QPalette, QColor
-from core.syntax_highlighter import SyntaxHighlighter
 import database_manager as db
-from .image_dialog import ImageDialog
+from .search_worker import SearchTask
+from .language_worker import LanguageGuessTask
+from .format_worker import FormatTask
+from .startup_worker import StartupTask
+from .code_editor import CodeEditor
+from .snippet_list_model import SnippetListModel, SNIPPET_ID_ROLE, MATCH_LINE_ROLE
+
+# Wait this long after the last keystroke before starting a search
+SEARCH_DEBOUNCE_MS = 150
 
 class MainWindow(QMainWindow):
+    """
+    The snippet manager window.
+
+    Start-up is split in two so the window appears as soon as possible: the
+    constructor only builds widgets, and finish_startup (run once the window
+    has been painted) loads Pygments for the highlighter and opens the
+    database on a worker thread. Until that has upgraded the schema and read
+    the first page of the list, the controls that use the database are
+    disabled. The image export stack is imported when the export dialog is
+    first opened.
+    """
+    # Emitted on the first paint, and once the snippet list has been filled
+    firstPainted = pyqtSignal()
+    startupFinished = pyqtSignal()
+    # A class attribute: Qt delivers events while the constructor runs
+    startup_scheduled = False
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("CodeSnap - Snippet Manager")
+        self.highlighter = None
         
         # --- TIER 3: Dirty flag to track unsaved changes ---
         self.is_dirty = False
 
         self.current_snippet_id = None
         self.favorites_only = False
+        # Set while the list is changed programmatically, so selection changes
+        # caused by it don't load (or prompt to save) a snippet
+        self.ignore_selection_change = False
+
+        # --- Off-thread search state ---
+        # A single search thread: a new search cancels the running one, so
+        # there is never more than one query worth waiting for.
+        self.search_pool = QThreadPool(self)
+        self.search_pool.setMaxThreadCount(1)
+        # Keep the thread for the life of the window: each new thread would
+        # open its own connection, and the expired one's would stay open
+        self.search_pool.setExpiryTimeout(-1)
+        self.startup_pool = QThreadPool(self)
+        self.startup_pool.setMaxThreadCount(1)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(self.run_search)
+        self.search_generation = 0
+        self.search_task = None
+        self.search_requested_at = None
+        self.last_search_latency_ms = None
+        # Bumped whenever the code is replaced, so late guesses are dropped
+        self.language_guess_generation = 0
+        self.format_generation = 0
 
         self.setStatusBar(QStatusBar(self))
         self.statusBar().showMessage("Ready", 3000)
@@ -42,22 +92,48 @@ class MainWindow(QMainWindow):
         search_filter_layout = QHBoxLayout()
         self.search_input = QLineEdit()
         self.search_input.setPlaceholderText("Search snippets...")
-        self.search_input.textChanged.connect(self.search_snippets)
+        self.search_input.textChanged.connect(self.schedule_search)
         
         self.favorites_button = QPushButton("★")
         self.favorites_button.setToolTip("Show only favorites")
         self.favorites_button.setCheckable(True)
         self.favorites_button.clicked.connect(self.filter_favorites)
         self.favorites_button.setFixedWidth(40)
+
+        self.regex_button = QPushButton(".*")
+        self.regex_button.setToolTip("Search code with a regular expression")
+        self.regex_button.setCheckable(True)
+        self.regex_button.toggled.connect(self.toggle_regex_search)
+        self.regex_button.setFixedWidth(40)
         
         search_filter_layout.addWidget(self.search_input)
+        search_filter_layout.addWidget(self.regex_button)
         search_filter_layout.addWidget(self.favorites_button)
         
-        self.snippet_list = QListWidget()
-        self.snippet_list.currentItemChanged.connect(self.load_snippet)
+        # Model/view list: only visible rows are laid out, and rows are loaded
+        # from the database a page at a time as the list scrolls
+        self.snippet_model = SnippetListModel(self)
+        self.snippet_list = QListView()
+        self.snippet_list.setUniformItemSizes(True)
+        self.snippet_list.setModel(self.snippet_model)
+        self.snippet_list.selectionModel().currentChanged.connect(self.load_snippet)
+
+        # Tag facets with their snippet counts: checking tags narrows the list
+        # (and searches) to snippets that have all, or any, of them
+        self.tag_match_combo = QComboBox()
+        self.tag_match_combo.addItems(["Match all tags", "Match any tag"])
+        self.tag_match_combo.currentIndexChanged.connect(self.run_search)
+        self.tag_list = QListWidget()
+        self.tag_list.setMaximumHeight(160)
+        self.tag_list.itemChanged.connect(self.run_search)
+        tag_header_layout = QHBoxLayout()
+        tag_header_layout.addWidget(QLabel("Tags:"))
+        tag_header_layout.addWidget(self.tag_match_combo)
 
         left_layout.addLayout(search_filter_layout)
         left_layout.addWidget(self.snippet_list)
+        left_layout.addLayout(tag_header_layout)
+        left_layout.addWidget(self.tag_list)
 
         # --- Right Panel ---
         right_panel = QWidget()
@@ -82,11 +158,19 @@ class MainWindow(QMainWindow):
         form_layout.setRowWrapPolicy(QFormLayout.RowWrapPolicy.WrapAllRows)
         self.language_input = QComboBox()
         self.language_input.addItems(['python', 'javascript', 'sql', 'html', 'css', 'bash', 'text'])
+        self.auto_language_button = QPushButton("Auto")
+        self.auto_language_button.setToolTip("Detect the language of pasted code")
+        self.auto_language_button.setCheckable(True)
+        self.auto_language_button.setChecked(True)
+        self.auto_language_button.setFixedWidth(50)
+        language_layout = QHBoxLayout()
+        language_layout.addWidget(self.language_input)
+        language_layout.addWidget(self.auto_language_button)
         self.tags_input = QLineEdit()
-        form_layout.addRow(QLabel("Language:"), self.language_input)
+        form_layout.addRow(QLabel("Language:"), language_layout)
         form_layout.addRow(QLabel("Tags (comma-separated):"), self.tags_input)
 
-        self.code_editor = QTextEdit()
+        self.code_editor = CodeEditor()
         self.code_editor.setFont(QFont("Fira Code", 12)) 
         self.code_editor.setTabStopDistance(28) 
         
@@ -95,14 +179,14 @@ class MainWindow(QMainWindow):
         palette.setColor(QPalette.ColorRole.Text, QColor("#F8F8F2"))
         self.code_editor.setPalette(palette)
 
-        self.highlighter = SyntaxHighlighter(self.code_editor.document(), language='python', style='monokai')
-        self.language_input.currentTextChanged.connect(lambda lang: self.highlighter.set_language(lang))
+        self.language_input.currentTextChanged.connect(lambda lang: self.code_editor.set_language(lang))
 
         # --- TIER 3: Connect signals to set the dirty flag ---
         self.title_input.textChanged.connect(self.set_dirty)
         self.tags_input.textChanged.connect(self.set_dirty)
         self.language_input.currentTextChanged.connect(self.set_dirty)
-        self.code_editor.textChanged.connect(self.set_dirty)
+        self.code_editor.userTextChanged.connect(self.set_dirty)
+        self.code_editor.textPasted.connect(self.guess_language)
 
         button_layout = QHBoxLayout()
         
@@ -130,8 +214,17 @@ class MainWindow(QMainWindow):
         self.copy_button.clicked.connect(self.copy_code_to_clipboard)
         self.export_button.clicked.connect(self.open_export_dialog)
         
-        save_shortcut = QShortcut(QKeySequence("Ctrl+S"), self)
-        save_shortcut.activated.connect(self.save_snippet)
+        self.save_shortcut = QShortcut(QKeySequence("Ctrl+S"), self)
+        self.save_shortcut.activated.connect(self.save_snippet)
+
+        # Enabled by apply_startup once the database is ready
+        self.database_controls = [
+            self.search_input, self.regex_button, self.favorites_button, self.snippet_list,
+            self.tag_match_combo, self.tag_list, self.new_button, self.save_button,
+            self.delete_button, self.favorite_toggle_button, self.save_shortcut,
+        ]
+        for control in self.database_controls:
+            control.setEnabled(False)
 
         right_layout.addLayout(title_layout)
         right_layout.addWidget(details_form)
@@ -153,11 +246,53 @@ class MainWindow(QMainWindow):
         else:
             self.splitter.setSizes([300, 900]) # Default fallback
 
-        self.refresh_snippet_list()
+    def event(self, event):
+        # Defer the rest of start-up until the first paint has reached the screen
+        if not self.startup_scheduled and event.type() == QEvent.Type.Paint:
+            self.startup_scheduled = True
+            QTimer.singleShot(0, self.finish_startup)
+            self.firstPainted.emit()
+        return super().event(event)
+
+    def finish_startup(self):
+        from core.syntax_highlighter import SyntaxHighlighter
+        self.highlighter = SyntaxHighlighter(self.code_editor.document(),
+                                             language=self.language_input.currentText(), style='monokai')
+        self.code_editor.set_highlighter(self.highlighter)
+
+        # An upgrade can rebuild indexes of the whole library, so the window
+        # keeps painting while it runs
+        self.statusBar().showMessage("Opening snippet library...")
+        task = StartupTask(self.favorites_only, self.selected_tags(), self.match_all_tags())
+        task.signals.progress.connect(self.show_startup_progress)
+        task.signals.finished.connect(self.apply_startup)
+        task.signals.failed.connect(self.startup_failed)
+        self.startup_pool.start(task)
+
+    def show_startup_progress(self, step):
+        self.statusBar().showMessage(f"Upgrading database: {step}")
+
+    def apply_startup(self, first_page, tag_counts):
+        for control in self.database_controls:
+            control.setEnabled(True)
+        self.refresh_tag_facets(tag_counts)
+        with self.list_update():
+            self.snippet_model.browse(self.favorites_only, self.selected_tags(), self.match_all_tags(), first_page)
+        self.select_current_snippet()
+        self.statusBar().showMessage("Ready", 3000)
+        self.startupFinished.emit()
+
+    def startup_failed(self, message):
+        self.statusBar().showMessage("Could not open the snippet library.")
+        QMessageBox.critical(self, "Database Error", f"Could not open the snippet library:\n{message}")
 
     # --- TIER 3: Override the closeEvent to handle saving settings and checking for unsaved changes ---
     def closeEvent(self, event):
         if self.check_for_unsaved_changes():
+            self.cancel_search()
+            self.search_pool.waitForDone()
+            # Let a database upgrade in progress finish rather than cut it off
+            self.startup_pool.waitForDone()
             # Save settings before closing
             self.settings.setValue("geometry", self.saveGeometry())
             self.settings.setValue("splitterState", self.splitter.saveState())
@@ -201,56 +336,164 @@ class MainWindow(QMainWindow):
     # ... all other functions from here on are updated to call set_dirty(False) after key actions ...
 
     def refresh_snippet_list(self):
-        # ... (unchanged)
-        current_id_to_preserve = self.current_snippet_id
-        self.snippet_list.currentItemChanged.disconnect(self.load_snippet)
-        self.snippet_list.clear()
-        
-        snippets = db.get_favorite_snippets() if self.favorites_only else db.get_all_snippets()
-            
-        item_to_select = None
-        for snippet in snippets:
-            title = f"★ {snippet['title']}" if snippet['is_favorite'] else snippet['title']
-            item = QListWidgetItem(title)
-            item.setData(Qt.ItemDataRole.UserRole, snippet['id'])
-            self.snippet_list.addItem(item)
-            if snippet['id'] == current_id_to_preserve:
-                item_to_select = item
-
-        self.snippet_list.currentItemChanged.connect(self.load_snippet)
-        
-        if item_to_select:
-            self.snippet_list.setCurrentItem(item_to_select)
-
-    def search_snippets(self):
-        # ... (unchanged)
+        """Shows the whole library (or favorites), keeping the current snippet selected."""
+        with self.list_update():
+            self.snippet_model.browse(self.favorites_only, self.selected_tags(), self.match_all_tags())
+        self.select_current_snippet()
+
+    def refresh_tag_facets(self, tag_counts=None):
+        """
+        Reloads the tag facets and their counts (unless already read into
+        `tag_counts`), keeping checked tags checked. If a checked tag is no
+        longer in use, the list is filtered again.
+        """
+        checked = self.selected_tags()
+        checked_names = {name.casefold() for name in checked}
+        self.tag_list.blockSignals(True)
+        self.tag_list.clear()
+        for tag in db.get_tag_counts() if tag_counts is None else tag_counts:
+            item = QListWidgetItem(f"{tag['name']} ({tag['snippet_count']})")
+            item.setData(Qt.ItemDataRole.UserRole, tag['name'])
+            item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+            is_checked = tag['name'].casefold() in checked_names
+            item.setCheckState(Qt.CheckState.Checked if is_checked else Qt.CheckState.Unchecked)
+            self.tag_list.addItem(item)
+        self.tag_list.blockSignals(False)
+        if len(self.selected_tags()) != len(checked):
+            self.run_search()
+
+    def selected_tags(self):
+        return [
+            self.tag_list.item(row).data(Qt.ItemDataRole.UserRole)
+            for row in range(self.tag_list.count())
+            if self.tag_list.item(row).checkState() == Qt.CheckState.Checked
+        ]
+
+    def match_all_tags(self):
+        return self.tag_match_combo.currentIndex() == 0
+
+    @contextmanager
+    def list_update(self):
+        """Wraps programmatic list changes (see ignore_selection_change)."""
+        previous = self.ignore_selection_change
+        self.ignore_selection_change = True
+        try:
+            yield
+        finally:
+            self.ignore_selection_change = previous
+
+    def select_current_snippet(self):
+        """Highlights the row of the snippet being edited, if it is loaded."""
+        row = self.snippet_model.row_of(self.current_snippet_id) if self.current_snippet_id else -1
+        with self.list_update():
+            if row >= 0:
+                self.snippet_list.setCurrentIndex(self.snippet_model.index(row))
+            else:
+                self.snippet_list.selectionModel().clear()
+
+    def schedule_search(self):
+        """Restarts the debounce timer; the search runs once typing pauses."""
+        # Latency is measured from the last keystroke, the one the results answer
+        self.search_requested_at = time.perf_counter()
+        self.search_timer.start()
+
+    def cancel_search(self):
+        self.search_timer.stop()
+        if self.search_task:
+            self.search_task.cancel()
+            self.search_task = None
+
+    def run_search(self):
+        """Cancels any search still running and starts a new one on the search thread."""
+        self.cancel_search()
+        if self.search_requested_at is None:
+            # Started directly (filters, regex toggle), not by typing
+            self.search_requested_at = time.perf_counter()
+
+        self.search_generation += 1
         query = self.search_input.text()
-        self.snippet_list.currentItemChanged.disconnect(self.load_snippet)
-        self.snippet_list.clear()
+        if not query:
+            # No search: page through the library instead of loading it all
+            self.refresh_snippet_list()
+            self.search_requested_at = None
+            return
+        task = SearchTask(
+            self.search_generation, query, self.favorites_only,
+            regex_mode=self.regex_button.isChecked() and bool(query),
+            tags=self.selected_tags(), match_all=self.match_all_tags(),
+        )
+        task.signals.finished.connect(self.apply_search_results)
+        task.signals.failed.connect(self.search_failed)
+        self.search_task = task
+        self.search_pool.start(task)
+
+    def search_failed(self, generation, message):
+        if generation != self.search_generation:
+            return
+        self.search_task = None
+        self.search_requested_at = None
+        self.statusBar().showMessage(message, 3000)
+
+    def apply_search_results(self, generation, snippets, query_seconds):
+        if generation != self.search_generation:
+            return  # a newer search has started since
+        self.search_task = None
+
+        # All results go into the model in one reset
+        with self.list_update():
+            self.snippet_model.set_search_results(snippets, self.favorites_only,
+                                                  self.selected_tags(), self.match_all_tags())
+        self.select_current_snippet()
+
+        # Keystroke-to-results latency, including the debounce delay
+        self.last_search_latency_ms = (time.perf_counter() - self.search_requested_at) * 1000
+        self.search_requested_at = None
+        self.statusBar().showMessage(
+            f"{len(snippets)} results in {self.last_search_latency_ms:.0f} ms "
+            f"(query {query_seconds * 1000:.1f} ms)", 3000
+        )
+
+    def toggle_regex_search(self, enabled):
+        if enabled:
+            self.search_input.setPlaceholderText("Regex search in code...")
+        else:
+            self.search_input.setPlaceholderText("Search snippets...")
+        self.run_search()
 
-        snippets = db.search_snippets(query, self.favorites_only)
+    def guess_language(self):
+        """Picks the language of pasted code in the background, if enabled."""
+        if not self.auto_language_button.isChecked():
+            return
+        self.language_guess_generation += 1
+        languages = [self.language_input.itemText(i) for i in range(self.language_input.count())]
+        task = LanguageGuessTask(self.language_guess_generation, self.code_editor.toPlainText(), languages)
+        task.signals.finished.connect(self.apply_language_guess)
+        QThreadPool.globalInstance().start(task)
+
+    def apply_language_guess(self, generation, language):
+        if generation != self.language_guess_generation or not language:
+            return
+        if language != self.language_input.currentText():
+            self.language_input.setCurrentText(language)
+            self.statusBar().showMessage(f"Detected language: {language}", 3000)
 
-        for snippet in snippets:
-            title = f"★ {snippet['title']}" if snippet['is_favorite'] else snippet['title']
-            item = QListWidgetItem(title)
-            item.setData(Qt.ItemDataRole.UserRole, snippet['id'])
-            self.snippet_list.addItem(item)
-        
-        self.snippet_list.currentItemChanged.connect(self.load_snippet)
+    def load_snippet(self, current, previous):
+        if self.ignore_selection_change:
+            return
 
-    def load_snippet(self, current_item, previous_item):
         # --- MODIFIED --- to check for unsaved changes before loading
         if not self.check_for_unsaved_changes():
             # Reselect the previous item to cancel the change
-            if previous_item:
-                self.snippet_list.setCurrentItem(previous_item)
+            if previous.isValid():
+                with self.list_update():
+                    self.snippet_list.setCurrentIndex(previous)
             return
 
-        if not current_item:
+        if not current.isValid():
             self.new_snippet(check_save=False) # Don't check again
             return
         
-        snippet_id = current_item.data(Qt.ItemDataRole.UserRole)
+        snippet_id = current.data(SNIPPET_ID_ROLE)
         self.current_snippet_id = snippet_id
         snippet = db.get_snippet_by_id(snippet_id)
         
@@ -260,10 +503,20 @@ class MainWindow(QMainWindow):
             self.favorite_toggle_button.setText("★" if snippet['is_favorite'] else "☆")
             
             self.title_input.setText(snippet['title'])
+            # Switch language while the editor is empty, so the old text
+            # isn't re-highlighted just before it is replaced
+            self.code_editor.clear()
+            self.language_guess_generation += 1
+            self.format_generation += 1
             self.language_input.setCurrentText(snippet['language'])
+            self.code_editor.set_language(snippet['language'])
             self.tags_input.setText(snippet['tags'])
-            self.code_editor.setPlainText(snippet['code'])
-            self.highlighter.set_language(snippet['language'])
+            self.code_editor.load_text(snippet['code'])
+
+            # Regex search results jump straight to the first matching line
+            match_line = current.data(MATCH_LINE_ROLE)
+            if match_line:
+                self.code_editor.go_to_line(match_line)
             
             self.set_dirty(False) # Mark as clean after loading
 
@@ -271,13 +524,15 @@ class MainWindow(QMainWindow):
         if check_save and not self.check_for_unsaved_changes():
             return
 
-        self.snippet_list.clearSelection()
         self.current_snippet_id = None
+        self.select_current_snippet()
         self.title_input.clear()
         self.language_input.setCurrentIndex(0) 
         self.tags_input.clear()
         self.code_editor.clear()
-        self.highlighter.set_language('python')
+        self.language_guess_generation += 1
+        self.format_generation += 1
+        self.code_editor.set_language('python')
         self.favorite_toggle_button.setVisible(False)
         self.title_input.setFocus()
         self.set_dirty(False) # Mark as clean
@@ -295,19 +550,26 @@ class MainWindow(QMainWindow):
         if self.current_snippet_id:
             db.update_snippet(self.current_snippet_id, title, language, tags, code)
         else:
-            db.add_snippet(title, language, tags, code)
+            self.current_snippet_id = db.add_snippet(title, language, tags, code)
+            self.favorite_toggle_button.setVisible(True)
         
         self.set_dirty(False) # Mark as clean after saving
-        self.refresh_snippet_list()
+        with self.list_update():
+            self.snippet_model.snippet_changed(self.current_snippet_id)
+        self.select_current_snippet()
+        self.refresh_tag_facets()
         self.statusBar().showMessage(f"Snippet '{title}' saved!", 3000)
 
     def delete_snippet(self):
         if not self.current_snippet_id: return
         title = self.title_input.text()
         if QMessageBox.question(self, 'Delete', f"Delete '{title}'?") == QMessageBox.StandardButton.Yes:
-            db.delete_snippet(self.current_snippet_id)
+            deleted_id = self.current_snippet_id
+            db.delete_snippet(deleted_id)
             self.new_snippet(check_save=False) # Don't check for save, we just deleted it
-            self.refresh_snippet_list()
+            with self.list_update():
+                self.snippet_model.snippet_removed(deleted_id)
+            self.refresh_tag_facets()
             self.statusBar().showMessage(f"Snippet '{title}' deleted.", 3000)
 
     def toggle_favorite(self):
@@ -316,7 +578,10 @@ class MainWindow(QMainWindow):
         new_status = db.toggle_favorite_status(self.current_snippet_id)
         self.favorite_toggle_button.setChecked(new_status)
         self.favorite_toggle_button.setText("★" if new_status else "☆")
-        self.refresh_snippet_list()
+        # Only this snippet's row changes (or leaves the favorites view)
+        with self.list_update():
+            self.snippet_model.snippet_changed(self.current_snippet_id)
+        self.select_current_snippet()
         self.statusBar().showMessage("Favorite status changed.", 2000)
 
     def filter_favorites(self):
@@ -331,58 +596,36 @@ class MainWindow(QMainWindow):
         self.refresh_snippet_list()
 
     def prettify_code(self):
-        # ... (unchanged, but will now set the dirty flag)
+        """Formats the code on a worker thread; see apply_prettified_code."""
         language = self.language_input.currentText()
         source_code = self.code_editor.toPlainText()
 
         if not source_code.strip():
             self.statusBar().showMessage("Nothing to prettify.", 3000)
             return
-        
-        try:
-            formatted_code = ""
-            if language == 'python':
-                result = subprocess.run(
-                    ['black', '-q', '-'], 
-                    input=source_code, 
-                    capture_output=True, 
-                    text=True, 
-                    check=True
-                )
-                formatted_code = result.stdout
-            
-            elif language in ['javascript', 'html', 'css']:
-                opts = jsbeautifier.default_options()
-                opts.indent_size = 2
-                opts.preserve_newlines = True
-                opts.max_preserve_newlines = 2
-                opts.wrap_line_length = 100
-
-                if language == 'javascript':
-                    formatted_code = jsbeautifier.beautify(source_code, opts)
-                elif language == 'html':
-                    formatted_code = jsbeautifier.beautify_html(source_code, opts)
-                elif language == 'css':
-                    formatted_code = jsbeautifier.beautify_css(source_code, opts)
-            
-            else:
-                self.statusBar().showMessage(f"No prettifier available for '{language}'.", 3000)
-                return
-            
-            if formatted_code and formatted_code != source_code:
-                self.code_editor.setPlainText(formatted_code)
-                self.statusBar().showMessage("Code prettified successfully!", 3000)
-                # Prettifying counts as a change
-                self.set_dirty()
-
-        except subprocess.CalledProcessError as e:
-            self.statusBar().showMessage("Black formatter failed: Code may have a syntax error.", 5000)
-            print(f"Black formatter error: {e.stderr}")
-        except FileNotFoundError:
-            self.statusBar().showMessage("Error: 'black' is not installed or not in your PATH.", 5000)
-        except Exception as e:
-            self.statusBar().showMessage(f"An error occurred during formatting: {e}", 5000)
-            print(f"Formatting error: {e}")
+
+        self.format_generation += 1
+        task = FormatTask(self.format_generation, source_code, language)
+        task.signals.finished.connect(self.apply_prettified_code)
+        task.signals.failed.connect(self.prettify_failed)
+        self.statusBar().showMessage("Prettifying...")
+        QThreadPool.globalInstance().start(task)
+
+    def apply_prettified_code(self, generation, source_code, formatted_code):
+        # Drop the result if another snippet was loaded or the code was edited meanwhile
+        if generation != self.format_generation or self.code_editor.toPlainText() != source_code:
+            return
+        if formatted_code and formatted_code != source_code:
+            self.code_editor.load_text(formatted_code)
+            self.statusBar().showMessage("Code prettified successfully!", 3000)
+            # Prettifying counts as a change
+            self.set_dirty()
+        else:
+            self.statusBar().showMessage("Code is already pretty.", 3000)
+
+    def prettify_failed(self, generation, message):
+        if generation == self.format_generation:
+            self.statusBar().showMessage(message, 5000)
 
     def copy_code_to_clipboard(self):
         # ... (unchanged)
@@ -401,5 +644,7 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "No Code", "There's no code to export as an image.")
             return
         language = self.language_input.currentText()
+        # Imported on first use: it brings in Pillow and the renderer
+        from .image_dialog import ImageDialog
         dialog = ImageDialog(code, language, self)
         dialog.exec()
\ No newline at end of file
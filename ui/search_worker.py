@@ -0,0 +1,59 @@
+# codesnap/ui/search_worker.py
+
+import re
+import threading
+import time
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+import database_manager as db
+
+
+class SearchSignals(QObject):
+    """Signals emitted by a SearchTask, delivered on the GUI thread."""
+    # generation, rows, seconds spent in the query
+    finished = pyqtSignal(int, object, float)
+    failed = pyqtSignal(int, str)
+
+
+class SearchTask(QRunnable):
+    """
+    Runs one snippet search on a worker thread.
+
+    Every task carries the generation number it was started with so the window
+    can drop results that arrive after a newer search was started. Calling
+    cancel() aborts the query at the next SQLite progress check.
+    """
+    def __init__(self, generation, query, favorites_only=False, regex_mode=False, tags=(), match_all=True):
+        super().__init__()
+        self.generation = generation
+        self.query = query
+        self.favorites_only = favorites_only
+        self.tags = list(tags)
+        self.match_all = match_all
+        self.regex_mode = regex_mode
+        self.cancel_event = threading.Event()
+        self.signals = SearchSignals()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        if self.cancel_event.is_set():
+            return  # superseded before it got a thread
+        start = time.perf_counter()
+        try:
+            with db.cancellable(self.cancel_event):
+                if self.regex_mode:
+                    rows = db.regex_search_snippets(self.query, self.favorites_only, self.tags, self.match_all)
+                else:
+                    rows = db.search_snippets(self.query, self.favorites_only,
+                                              tags=self.tags, match_all=self.match_all)
+        except db.QueryCancelled:
+            return
+        except re.error as e:
+            self.signals.failed.emit(self.generation, f"Invalid regular expression: {e}")
+            return
+        except Exception as e:
+            self.signals.failed.emit(self.generation, f"Search failed: {e}")
+            return
+        if not self.cancel_event.is_set():
+            self.signals.finished.emit(self.generation, rows, time.perf_counter() - start)
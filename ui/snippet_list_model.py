@@ -0,0 +1,204 @@
+# codesnap/ui/snippet_list_model.py
+
+from bisect import bisect_left
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex
+import database_manager as db
+
+# Custom item data roles
+SNIPPET_ID_ROLE = Qt.ItemDataRole.UserRole
+MATCH_LINE_ROLE = Qt.ItemDataRole.UserRole + 1
+
+
+class SnippetListModel(QAbstractListModel):
+    """
+    List model for the snippet panel.
+
+    In browse mode rows are fetched lazily, one keyset page at a time, as the
+    view scrolls (canFetchMore/fetchMore). In search mode the model holds the
+    ranked results of one search. Either way, saving, deleting or starring a
+    snippet is applied as a change to that single row.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []
+        self.favorites_only = False
+        self.tags = []
+        self.match_all = True
+        self.search_mode = False
+        self.exhausted = True
+
+    # --- Loading ---
+
+    def browse(self, favorites_only=False, tags=(), match_all=True, first_page=None):
+        """
+        Resets to the whole library (or favorites, or snippets tagged `tags`)
+        in title order. `first_page` is the first page if already fetched.
+        """
+        self.beginResetModel()
+        self.rows = []
+        self.favorites_only = favorites_only
+        self.tags = list(tags)
+        self.match_all = match_all
+        self.search_mode = False
+        self.exhausted = False
+        self.endResetModel()
+        if first_page is None:
+            self.fetchMore(QModelIndex())
+        else:
+            self._append_page(first_page)
+
+    def set_search_results(self, snippets, favorites_only=False, tags=(), match_all=True):
+        """Replaces the contents with one batch of search results."""
+        self.beginResetModel()
+        self.rows = [dict(snippet) for snippet in snippets]
+        self.favorites_only = favorites_only
+        self.tags = list(tags)
+        self.match_all = match_all
+        self.search_mode = True
+        self.exhausted = True
+        self.endResetModel()
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and not self.exhausted
+
+    def fetchMore(self, parent):
+        if parent.isValid() or self.exhausted:
+            return
+        after_title = after_id = None
+        if self.rows:
+            after_title, after_id = self.rows[-1]['title'], self.rows[-1]['id']
+        page = db.get_snippets_page(after_title, after_id, favorites_only=self.favorites_only,
+                                    tags=self.tags, match_all=self.match_all)
+        self._append_page(page)
+
+    def _append_page(self, page):
+        if len(page) < db.SNIPPET_PAGE_SIZE:
+            self.exhausted = True
+        if not page:
+            return
+        first = len(self.rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(page) - 1)
+        self.rows.extend(dict(row) for row in page)
+        self.endInsertRows()
+
+    # --- Qt model interface ---
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        snippet = self.rows[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            title = f"★ {snippet['title']}" if snippet['is_favorite'] else snippet['title']
+            lines = snippet.get('lines')
+            if lines:
+                shown = ", ".join(str(line) for line in lines[:5]) + (", …" if len(lines) > 5 else "")
+                title = f"{title}  (line {shown})" if len(lines) == 1 else f"{title}  (lines {shown})"
+            return title
+        if role == Qt.ItemDataRole.ToolTipRole:
+            # Shows where a search matched (title, tags or inside the code)
+            return snippet.get('match')
+        if role == SNIPPET_ID_ROLE:
+            return snippet['id']
+        if role == MATCH_LINE_ROLE:
+            lines = snippet.get('lines')
+            return lines[0] if lines else None
+        return None
+
+    # --- Lookups ---
+
+    def row_of(self, snippet_id):
+        """Returns the row showing `snippet_id`, or -1 if it isn't loaded."""
+        for row, snippet in enumerate(self.rows):
+            if snippet['id'] == snippet_id:
+                return row
+        return -1
+
+    def _find_row(self, snippet):
+        """Like row_of, but a binary search when rows are in title order."""
+        if self.search_mode:
+            return self.row_of(snippet['id'])
+        row = bisect_left(self.rows, db.list_sort_key(snippet), key=db.list_sort_key)
+        if row < len(self.rows) and self.rows[row]['id'] == snippet['id']:
+            return row
+        return -1
+
+    def _insert_position(self, snippet):
+        """Sorted position for a new row, or -1 if it lies beyond the loaded pages."""
+        row = bisect_left(self.rows, db.list_sort_key(snippet), key=db.list_sort_key)
+        if row == len(self.rows) and not self.exhausted:
+            return -1  # fetchMore will pick it up when the view gets there
+        return row
+
+    # --- Targeted updates ---
+
+    def snippet_changed(self, snippet_id):
+        """Applies an insert or update of one snippet to the rows shown."""
+        snippet = db.get_snippet_summary(snippet_id)
+        if snippet is None:
+            self.snippet_removed(snippet_id)
+            return
+        snippet = dict(snippet)
+        # Unless the title changed, the row is still where its new key sorts
+        row = self._find_row(snippet)
+        if row < 0:
+            row = self.row_of(snippet_id)
+
+        if not self._passes_filters(snippet):
+            if row >= 0:
+                self._remove_row(row)
+            return
+
+        if row < 0:
+            if not self.search_mode:
+                self._insert_row(snippet)
+            return
+
+        # Keep search-specific columns (excerpt, line numbers) of the old row
+        snippet = {**self.rows[row], **snippet}
+        if not self.search_mode:
+            # A renamed snippet moves to its new sorted position. Moving (rather
+            # than remove + insert) keeps the view's selection on it.
+            dest = self._insert_position(snippet)
+            if dest < 0:
+                self._remove_row(row)
+                return
+            if dest not in (row, row + 1):
+                self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), dest)
+                del self.rows[row]
+                row = dest if dest < row else dest - 1
+                self.rows.insert(row, snippet)
+                self.endMoveRows()
+        self.rows[row] = snippet
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
+    def _passes_filters(self, snippet):
+        """Whether a changed snippet still belongs in the favorites/tag view shown."""
+        if self.favorites_only and not snippet['is_favorite']:
+            return False
+        if not self.tags:
+            return True
+        has = {name.casefold() for name in db.parse_tags(snippet['tags'])}
+        wanted = [name.casefold() in has for name in self.tags]
+        return all(wanted) if self.match_all else any(wanted)
+
+    def snippet_removed(self, snippet_id):
+        row = self.row_of(snippet_id)
+        if row >= 0:
+            self._remove_row(row)
+
+    def _insert_row(self, snippet):
+        row = self._insert_position(snippet)
+        if row < 0:
+            return
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.rows.insert(row, snippet)
+        self.endInsertRows()
+
+    def _remove_row(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.rows[row]
+        self.endRemoveRows()
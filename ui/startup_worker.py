@@ -0,0 +1,42 @@
+# codesnap/ui/startup_worker.py
+
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+import database_manager as db
+
+
+class StartupSignals(QObject):
+    """Signals emitted by a StartupTask, delivered on the GUI thread."""
+    # upgrade step being run
+    progress = pyqtSignal(str)
+    # first page of the snippet list, tag counts
+    finished = pyqtSignal(object, object)
+    failed = pyqtSignal(str)
+
+
+class StartupTask(QRunnable):
+    """
+    Opens the database on a worker thread: runs initialize_db, which can
+    rebuild indexes or move a large library's code on the first start after
+    an upgrade, then reads the first page of the list and the tag counts.
+    """
+    def __init__(self, favorites_only=False, tags=(), match_all=True):
+        super().__init__()
+        self.favorites_only = favorites_only
+        self.tags = list(tags)
+        self.match_all = match_all
+        self.signals = StartupSignals()
+
+    def run(self):
+        try:
+            db.initialize_db(progress=self.signals.progress.emit)
+            page = db.get_snippets_page(favorites_only=self.favorites_only,
+                                        tags=self.tags, match_all=self.match_all)
+            tag_counts = db.get_tag_counts()
+        except Exception as e:
+            print(f"Database error: {e}")
+            self.signals.failed.emit(str(e))
+            return
+        finally:
+            # Runs once; the pool's thread is left idle and later expires
+            db.close_thread_connection()
+        self.signals.finished.emit(page, tag_counts)